@@ -0,0 +1,63 @@
+#!/usr/bin/env python3
+'''
+Drives get requests against the synthetic mesh of load_mesh_config.py and reports throughput and latency.
+
+Run it in a container of the mesh, e.g.
+
+    docker compose -f docker-compose.yaml -f load_mesh/docker-compose.load.yaml run --rm \
+        -v $PWD/benchmarks:/root/benchmarks key-value-store \
+        python3 /root/benchmarks/load_driver.py --services 20 --endpoints 100 --workers 8 --duration 60
+'''
+import argparse
+import threading
+import time
+
+import numpy as np
+
+from dripline.core import Interface
+
+from load_mesh_config import endpoint_name
+
+
+def worker(i_worker, args, deadline, latencies, failures):
+    connection = Interface(dripline_mesh={"broker": args.broker, "broker_port": args.broker_port})
+    rng = np.random.default_rng(i_worker)
+    while time.monotonic() < deadline:
+        endpoint = endpoint_name(int(rng.integers(args.services)), int(rng.integers(args.endpoints)))
+        start = time.perf_counter()
+        try:
+            connection.get(endpoint)
+        except Exception:
+            failures[i_worker] += 1
+            continue
+        latencies[i_worker].append(time.perf_counter() - start)
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--services", type=int, default=10, help="Number of services of the mesh.")
+    parser.add_argument("--endpoints", type=int, default=100, help="Number of endpoints per service.")
+    parser.add_argument("--workers", type=int, default=4, help="Number of concurrent clients.")
+    parser.add_argument("--duration", type=float, default=30, help="Duration of the test in seconds.")
+    parser.add_argument("--broker", type=str, default="rabbit-broker", help="Broker host name.")
+    parser.add_argument("--broker-port", type=int, default=5672, help="Broker port.")
+    args = parser.parse_args()
+
+    latencies = [[] for i in range(args.workers)]
+    failures = [0] * args.workers
+    deadline = time.monotonic() + args.duration
+    threads = [threading.Thread(target=worker, args=(i, args, deadline, latencies, failures)) for i in range(args.workers)]
+    start = time.monotonic()
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    elapsed = time.monotonic() - start
+
+    all_latencies = np.concatenate([np.array(l) for l in latencies]) * 1e3
+    n_failures = sum(failures)
+    print(f"{len(all_latencies)} gets, {n_failures} failures in {elapsed:.1f} s with {args.workers} workers")
+    print(f"throughput: {len(all_latencies)/elapsed:.1f} gets/s")
+    if len(all_latencies):
+        p50, p90, p99 = np.percentile(all_latencies, [50, 90, 99])
+        print(f"latency [ms]: mean {all_latencies.mean():.2f}  p50 {p50:.2f}  p90 {p90:.2f}  p99 {p99:.2f}  max {all_latencies.max():.2f}")
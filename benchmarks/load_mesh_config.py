@@ -0,0 +1,78 @@
+#!/usr/bin/env python3
+'''
+Generates the configuration of a synthetic dripline mesh for load tests.
+
+Writes one dl-serve configuration per service, each with a number of SimulatedSensorEntity
+endpoints, and a docker compose file running these services against the broker of the
+docker-compose.yaml in the repository root. Run it from the repository root:
+
+    python3 benchmarks/load_mesh_config.py --services 20 --endpoints 100 --output load_mesh
+    docker compose -f docker-compose.yaml -f load_mesh/docker-compose.load.yaml up -d
+'''
+import argparse
+from pathlib import Path
+
+import numpy as np
+import yaml
+
+
+def endpoint_name(i_service, i_endpoint):
+    return f"sim_{i_service:04d}_{i_endpoint:04d}"
+
+def service_config(i_service, n_endpoints, rng, args):
+    endpoints = []
+    for i_endpoint in range(n_endpoints):
+        endpoints.append({"name": endpoint_name(i_service, i_endpoint),
+                          "module": "SimulatedSensorEntity",
+                          "initial_value": float(rng.uniform(0, 100)),
+                          "noise": float(rng.uniform(0, args.noise)),
+                          "random_walk": float(rng.uniform(0, args.random_walk)),
+                          "drift": float(rng.normal(0, args.drift)),
+                          "step_probability": args.step_probability,
+                          "step_size": float(rng.uniform(0, 10)),
+                          "dropout_probability": args.dropout_probability,
+                          "seed": int(rng.integers(2**31)),
+                          })
+        if args.log_interval:
+            endpoints[-1]["log_interval"] = args.log_interval
+    return {"name": f"sim_service_{i_service:04d}",
+            "module": "Service",
+            "endpoints": endpoints}
+
+def compose_service(config_file):
+    return {"image": "ghcr.io/project8/dragonfly:${DGFLY_IMG_TAG:-latest-dev}",
+            "depends_on": {"rabbit-broker": {"condition": "service_healthy"}},
+            # relative paths in compose files are resolved from the directory of the first file, i.e. the repository root
+            "volumes": [f"{config_file.as_posix() if config_file.is_absolute() else './' + config_file.as_posix()}:/root/{config_file.name}",
+                        "./dripline_mesh.yaml:/root/.dripline_mesh.yaml"],
+            "environment": ["DRIPLINE_USER=dripline", "DRIPLINE_PASSWORD=dripline"],
+            "command": f'bash -c "dl-serve -c /root/{config_file.name}"',
+            }
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--services", type=int, default=10, help="Number of services.")
+    parser.add_argument("--endpoints", type=int, default=100, help="Number of endpoints per service.")
+    parser.add_argument("--output", type=str, default="load_mesh", help="Output directory.")
+    parser.add_argument("--seed", type=int, default=0, help="Seed for the generated sensor parameters.")
+    parser.add_argument("--noise", type=float, default=1., help="Maximum gaussian noise of a sensor.")
+    parser.add_argument("--random-walk", type=float, default=0.1, help="Maximum random walk of a sensor.")
+    parser.add_argument("--drift", type=float, default=0.01, help="Standard deviation of the sensor drifts.")
+    parser.add_argument("--step-probability", type=float, default=0.001, help="Step probability per get.")
+    parser.add_argument("--dropout-probability", type=float, default=0.001, help="Dropout probability per get.")
+    parser.add_argument("--log-interval", type=float, default=0, help="Log interval of the endpoints, 0 to not log.")
+    args = parser.parse_args()
+
+    rng = np.random.default_rng(args.seed)
+    output = Path(args.output)
+    output.mkdir(parents=True, exist_ok=True)
+    compose = {"services": {}}
+    for i_service in range(args.services):
+        config_file = output / f"sim_service_{i_service:04d}.yaml"
+        with open(config_file, "w") as open_file:
+            yaml.safe_dump(service_config(i_service, args.endpoints, rng, args), open_file, sort_keys=False)
+        compose["services"][f"sim-service-{i_service:04d}"] = compose_service(config_file)
+    with open(output / "docker-compose.load.yaml", "w") as open_file:
+        yaml.safe_dump(compose, open_file, sort_keys=False)
+    print(f"Wrote {args.services} services with {args.endpoints} endpoints each to {output}")
@@ -0,0 +1,63 @@
+#!/usr/bin/env python3
+'''
+Micro-benchmark of the Pfeiffer telegram datatype codecs.
+
+Times the encode -> decode round trip of every datatype and compares the batch decoding
+of many gauge payloads with decoding them one by one.
+'''
+import argparse
+import timeit
+
+import numpy as np
+
+from dripline.extensions.pfeiffer_endpoint import PfeifferEntity, _codecs, decode_payloads
+
+samples = {"bool_old": True,
+           "uint":     123456,
+           "ureal":    12.34,
+           "string":   "HPT200",
+           "bool":     False,
+           "ushort":   42,
+           "uexpo":    1.5e-3,
+           "str16":    "PKR251 gauge",
+           "str8":     "TPG366",
+           "query":    "=?",
+           }
+
+def benchmark_round_trips(number):
+    print(f"{'datatype':10s} {'ns / round trip':>16s}  result")
+    for datatype, value in samples.items():
+        encode, decode = _codecs[datatype]
+        payload = encode(value)
+        assert len(payload) == PfeifferEntity._datatype[datatype], f"{datatype}: {payload} has wrong length"
+        duration = timeit.timeit(lambda: decode(encode(value)), number=number)
+        print(f"{datatype:10s} {duration/number*1e9:16.1f}  {value!r} -> {payload!r} -> {decode(payload)!r}")
+
+def benchmark_batch(n_gauges, number):
+    print(f"\nDecoding {n_gauges} payloads per sweep")
+    rng = np.random.default_rng(1)
+    pressures = 10.**rng.uniform(-9, 3, n_gauges)
+    for datatype in ["uexpo", "uint", "ureal", "bool"]:
+        encode, decode = _codecs[datatype]
+        if datatype == "uexpo":
+            payloads = [encode(p) for p in pressures]
+        elif datatype == "bool":
+            payloads = [encode(p > 1) for p in pressures]
+        else:
+            payloads = [encode(int(p) % 10000) for p in pressures]
+        loop = np.array([decode(p) for p in payloads], dtype=float)
+        batch = decode_payloads(payloads, datatype)
+        assert np.allclose(loop, batch), f"batch decoding of {datatype} differs"
+        t_loop = timeit.timeit(lambda: [decode(p) for p in payloads], number=number) / number
+        t_batch = timeit.timeit(lambda: decode_payloads(payloads, datatype), number=number) / number
+        print(f"{datatype:10s} loop {t_loop*1e6:10.1f} us   batch {t_batch*1e6:10.1f} us   speedup {t_loop/t_batch:5.1f}")
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument("--number", type=int, default=100000, help="Number of round trips timed per datatype.")
+    parser.add_argument("--gauges", type=int, default=10000, help="Number of payloads in a batch.")
+    args = parser.parse_args()
+
+    benchmark_round_trips(args.number)
+    benchmark_batch(args.gauges, max(1, args.number // 1000))
@@ -0,0 +1,225 @@
+#!/usr/bin/env python3
+'''
+Benchmark of the WatchDog sweep with local stand-ins for the dripline Interface, the docker daemons and the Slack webhook.
+
+The stand-ins have configurable latencies and failure rates, so the WatchDog can be run with thousands
+of checks and containers without a broker, docker socket or Slack. Reports the sweep time, CPU time,
+memory and alert throughput, e.g.
+
+    python3 benchmarks/watchdog_benchmark.py --checks 5000 --containers 2000 --hosts 4 --sweeps 5
+'''
+import argparse
+import contextlib
+import datetime
+import http.server
+import os
+import random
+import resource
+import sys
+import threading
+import time
+import tracemalloc
+import concurrent.futures
+
+import numpy as np
+
+# watchdog.py is imported the same way it is executed, as a script next to its modules
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), "..", "dragonfly"))
+from watchdog import WatchDog
+from docker_hosts import DockerHost
+
+
+class FakeInterface(object):
+    '''
+    Stand-in for dripline.core.Interface, returning values around 1 for every endpoint.
+    '''
+    def __init__(self, latency_s, failure_rate, alert_rate, seed=0):
+        self.latency_s = latency_s
+        self.failure_rate = failure_rate
+        self.alert_rate = alert_rate
+        self.random = random.Random(seed)
+        self.gets = 0
+
+    def get(self, endpoint):
+        self.gets += 1
+        if self.latency_s:
+            time.sleep(self.latency_s)
+        if self.random.random() < self.failure_rate:
+            raise TimeoutError(f"simulated timeout of {endpoint}")
+        # the benchmark checks fire for values greater than 1
+        value = 1.5 if self.random.random() < self.alert_rate else 0.5
+        return {"value_raw": value, "value_cal": value}
+
+
+class FakeContainer(object):
+    def __init__(self, name, running, restart_count, started_at):
+        self.name = name
+        self.status = "running" if running else "exited"
+        self.attrs = {"RestartCount": restart_count,
+                      "State": {"ExitCode": 0 if running else 1,
+                                "StartedAt": started_at,
+                                "Health": {"Status": "healthy" if running else "unhealthy"}}}
+
+
+class FakeDockerHost(DockerHost):
+    '''
+    Stand-in for a docker daemon with a fixed set of containers.
+    '''
+    def __init__(self, name, n_containers, latency_s, failure_rate, down_rate, seed=0):
+        DockerHost.__init__(self, name, timeout=max(1., 10 * latency_s))
+        self.random = random.Random(seed)
+        self.latency_s = latency_s
+        self.failure_rate = failure_rate
+        self.down_rate = down_rate
+        self.names = [f"{name}-container-{i:05d}" for i in range(n_containers)]
+        self.restart_counts = [0] * n_containers
+        self.started_at = [datetime.datetime.now().isoformat()] * n_containers
+
+    def connect(self):
+        self.client = self
+
+    def list_containers(self):
+        if self.latency_s:
+            time.sleep(self.latency_s)
+        if self.random.random() < self.failure_rate:
+            raise ConnectionError(f"simulated failure of docker host {self.name}")
+        containers = []
+        for i, name in enumerate(self.names):
+            running = self.random.random() >= self.down_rate
+            if not running:
+                # the restart policy restarts the container, which shows up as a restart in the next sweeps
+                self.restart_counts[i] += 1
+                self.started_at[i] = datetime.datetime.now().isoformat()
+            containers.append(FakeContainer(name, running, self.restart_counts[i], self.started_at[i]))
+        return containers
+
+
+class FakeWebhook(object):
+    '''
+    Local HTTP server standing in for the Slack webhook.
+    '''
+    def __init__(self, latency_s, failure_rate, seed=0):
+        self.posts = 0
+        fake = self
+        rng = random.Random(seed)
+
+        class Handler(http.server.BaseHTTPRequestHandler):
+            def do_POST(self):
+                self.rfile.read(int(self.headers.get("Content-Length", 0)))
+                fake.posts += 1
+                if latency_s:
+                    time.sleep(latency_s)
+                self.send_response(500 if rng.random() < failure_rate else 200)
+                self.end_headers()
+
+            def log_message(self, format, *args):
+                pass
+
+        self.server = http.server.ThreadingHTTPServer(("127.0.0.1", 0), Handler)
+        self.url = f"http://127.0.0.1:{self.server.server_address[1]}/"
+        self.thread = threading.Thread(target=self.server.serve_forever, daemon=True)
+        self.thread.start()
+
+    def close(self):
+        self.server.shutdown()
+
+
+class BenchmarkWatchDog(WatchDog):
+    '''
+    WatchDog using the stand-ins instead of the dripline mesh and docker daemons.
+    '''
+    def __init__(self, config, interface, docker_hosts):
+        self.fake_interface = interface
+        self.fake_docker_hosts = docker_hosts
+        WatchDog.__init__(self, None, config)
+
+    def setup_docker_client(self):
+        self.docker_hosts = self.fake_docker_hosts
+        self.docker_pool = concurrent.futures.ThreadPoolExecutor(max_workers=len(self.docker_hosts))
+
+    def setup_dripline_connection(self):
+        self.connection = self.fake_interface
+
+
+def make_config(args, webhook):
+    checks = [{"endpoint": f"bench_endpoint_{i:05d}",
+               "method": "greater",
+               "reference": 1.,
+               "message": "bench_endpoint_{i:05d} too high: {{value}}".format(i=i),
+               } for i in range(args.checks)]
+    return {"dripline_mesh": {},
+            "slack_hook": webhook.url,
+            "check_interval_s": 0,
+            "realert_interval_s": args.realert_interval,
+            "state_file": args.state_file,
+            "state_flush_interval_s": 0,
+            "observation_file": args.observation_file,
+            "blacklist_containers": [],
+            "check_endpoints": checks,
+            }
+
+def rss_mb():
+    # ru_maxrss is in kB on linux
+    return resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024.
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--checks", type=int, default=1000, help="Number of endpoint checks.")
+    parser.add_argument("--containers", type=int, default=500, help="Number of containers per docker host.")
+    parser.add_argument("--hosts", type=int, default=1, help="Number of docker hosts.")
+    parser.add_argument("--sweeps", type=int, default=5, help="Number of sweeps to time.")
+    parser.add_argument("--get-latency", type=float, default=0., help="Latency of a get in seconds.")
+    parser.add_argument("--get-failure-rate", type=float, default=0.001, help="Fraction of failing gets.")
+    parser.add_argument("--alert-rate", type=float, default=0.01, help="Fraction of gets returning a value which fires its check.")
+    parser.add_argument("--docker-latency", type=float, default=0.01, help="Latency of listing the containers of a host in seconds.")
+    parser.add_argument("--docker-failure-rate", type=float, default=0., help="Fraction of failing container lists.")
+    parser.add_argument("--down-rate", type=float, default=0.001, help="Fraction of containers found not running.")
+    parser.add_argument("--webhook-latency", type=float, default=0.001, help="Latency of the webhook in seconds.")
+    parser.add_argument("--webhook-failure-rate", type=float, default=0., help="Fraction of failing webhook posts.")
+    parser.add_argument("--realert-interval", type=float, default=0, help="realert_interval_s of the WatchDog.")
+    parser.add_argument("--state-file", type=str, default=None, help="State file of the WatchDog, flushed after every sweep.")
+    parser.add_argument("--observation-file", type=str, default=None, help="Observation file of the WatchDog, instead of printing the values.")
+    parser.add_argument("--trace-memory", action="store_true", help="Measure the peak python memory of the sweeps with tracemalloc (slow).")
+    parser.add_argument("--verbose", action="store_true", help="Do not discard the output of the WatchDog.")
+    args = parser.parse_args()
+
+    webhook = FakeWebhook(args.webhook_latency, args.webhook_failure_rate)
+    interface = FakeInterface(args.get_latency, args.get_failure_rate, args.alert_rate)
+    hosts = [FakeDockerHost(f"host{i}", args.containers, args.docker_latency, args.docker_failure_rate, args.down_rate, seed=i)
+             for i in range(args.hosts)]
+
+    output = open(os.devnull, "w") if not args.verbose else sys.stdout
+    with contextlib.redirect_stdout(output):
+        dog = BenchmarkWatchDog(make_config(args, webhook), interface, hosts)
+
+    if args.trace_memory:
+        tracemalloc.start()
+    sweep_times = []
+    cpu_times = []
+    posts_before = webhook.posts
+    start = time.perf_counter()
+    for sweep in range(args.sweeps):
+        wall = time.perf_counter()
+        cpu = time.process_time()
+        with contextlib.redirect_stdout(output):
+            dog.check_containers()
+            dog.check_endpoints()
+            dog.flush_state()
+        sweep_times.append(time.perf_counter() - wall)
+        cpu_times.append(time.process_time() - cpu)
+    elapsed = time.perf_counter() - start
+    alerts = webhook.posts - posts_before
+    peak = tracemalloc.get_traced_memory()[1] / 2**20 if args.trace_memory else None
+    dog.docker_pool.shutdown(wait=False)
+    if dog.observations is not None:
+        dog.observations.close()
+    webhook.close()
+
+    sweep_times = np.array(sweep_times)
+    print(f"{args.checks} checks, {args.hosts} x {args.containers} containers, {args.sweeps} sweeps")
+    print(f"sweep time [s]: mean {sweep_times.mean():.3f}  min {sweep_times.min():.3f}  max {sweep_times.max():.3f}")
+    print(f"cpu time per sweep [s]: {np.mean(cpu_times):.3f}")
+    print(f"gets: {interface.gets}, {interface.gets / elapsed:.0f} per s")
+    print(f"alerts: {alerts}, {alerts / elapsed:.1f} per s")
+    print(f"max rss [MB]: {rss_mb():.1f}" + (f"  peak traced python memory [MB]: {peak:.1f}" if peak is not None else ""))
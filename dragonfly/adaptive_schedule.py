@@ -0,0 +1,102 @@
+'''
+Contains the AdaptiveSchedule class, deciding when the watchdog polls a check next
+'''
+
+__all__ = []
+
+__all__.append("AdaptiveSchedule")
+class AdaptiveSchedule(object):
+    '''
+    Poll interval of one check.
+    The interval shrinks towards min_interval_s as the value approaches the reference or changes quickly,
+    and grows towards max_interval_s while the value is stable and far from the reference on the side where the rule does not fire.
+    While the rule fires the check is polled every min_interval_s, so that changes and the recovery are seen quickly.
+    With min_interval_s == max_interval_s the check is polled at a fixed rate.
+    '''
+
+    def __init__(self, min_interval_s, max_interval_s, sensitivity=1.):
+        '''
+        Args:
+            min_interval_s (float): shortest poll interval, used at the reference
+            max_interval_s (float): longest poll interval
+            sensitivity (float): distance from the reference, relative to the reference (absolute if the reference is 0), at which the interval reaches max_interval_s
+        '''
+        self.min_interval_s = min_interval_s
+        self.max_interval_s = max(min_interval_s, max_interval_s)
+        self.sensitivity = sensitivity
+        self.interval_s = min_interval_s
+        self.next_due = 0.
+        self.last_value = None
+        self.last_time = None
+
+    def is_due(self, now):
+        return now >= self.next_due
+
+    def postpone(self, now):
+        '''
+        Keeps the current interval, e.g. when polling failed.
+        '''
+        self.next_due = now + self.interval_s
+
+    def update(self, value, reference, now, method=None, fired=False):
+        '''
+        Computes the next poll time from a freshly polled value.
+
+        Args:
+            value: polled value
+            reference: reference of the rule
+            now (float): time of the poll
+            method (str): comparison method of the rule, the distance is measured towards the side where it fires
+            fired (bool): True if the rule fired for value
+        '''
+        try:
+            value = float(value)
+            reference = float(reference)
+        except (TypeError, ValueError):
+            # no notion of distance for non-numeric values
+            self.interval_s = self.min_interval_s
+            self.next_due = now + self.interval_s
+            return
+
+        if fired:
+            self.interval_s = self.min_interval_s
+            self.next_due = now + self.interval_s
+            self.last_value = value
+            self.last_time = now
+            return
+
+        if method == "greater":
+            distance = reference - value
+        elif method == "lower":
+            distance = value - reference
+        else:
+            distance = abs(value - reference)
+        # a value beyond the reference fires the rule, this is only reached if fired was not given
+        distance = max(0., distance)
+        scale = self.sensitivity * (abs(reference) if reference != 0 else 1.)
+        closeness = min(1., distance / scale) if scale > 0 else 1.
+        interval = self.min_interval_s + (self.max_interval_s - self.min_interval_s) * closeness
+
+        if self.last_time is not None and now > self.last_time:
+            rate = abs(value - self.last_value) / (now - self.last_time)
+            if rate > 0:
+                # poll at least twice before the value could reach the reference at its current rate of change
+                interval = min(interval, distance / rate / 2.)
+
+        self.interval_s = min(self.max_interval_s, max(self.min_interval_s, interval))
+        self.next_due = now + self.interval_s
+        self.last_value = value
+        self.last_time = now
+
+    def to_state(self):
+        return {"interval_s": self.interval_s, "next_due": self.next_due, "last_value": self.last_value, "last_time": self.last_time}
+
+    def restore(self, state, now):
+        '''
+        Continues from a state saved with to_state, e.g. before a restart.
+        '''
+        self.interval_s = min(self.max_interval_s, max(self.min_interval_s, state["interval_s"]))
+        # the limits may have changed in the meantime
+        self.next_due = min(state["next_due"], now + self.interval_s)
+        self.last_value = state["last_value"]
+        self.last_time = state["last_time"]
@@ -0,0 +1,236 @@
+#!/usr/bin/env python3
+'''
+Offline evaluation of watchdog rules against recorded sensor data.
+
+Loads recorded time series from CSV or Parquet and reports when each rule of the check_endpoints
+of a watchdog configuration would have fired, using the same comparison semantics as the live WatchDog.
+
+The data is either in long format, with the columns "timestamp", "endpoint" and "value",
+or in wide format, with a "timestamp" column and one column per endpoint.
+Timestamps may be numbers (seconds since the epoch) or date strings.
+'''
+import argparse
+import csv
+import re
+import time
+import warnings
+from datetime import datetime
+from pathlib import Path
+
+import numpy as np
+import yaml
+
+try:
+    import pandas
+except ImportError:
+    pass
+
+try:
+    from .rules import compare_array
+except ImportError:
+    # backtest.py is executed as a script
+    from rules import compare_array
+
+__all__ = []
+
+def _as_values(column):
+    '''
+    Values of a text file keep their recorded type: the watchdog only compares floats as floats,
+    and floats are written with a decimal point or exponent (or as nan/inf), so only columns in which every value
+    is such a float literal become float arrays. Integer literals like "00" or "1" stay strings.
+    '''
+    values = column.tolist()
+    try:
+        floats = _parse_floats(values)
+    except ValueError:
+        return column.astype(str)
+    # only values without fractional part can be integer literals
+    integral = np.flatnonzero(floats == np.round(floats))
+    if not all(map(_float_mark, [values[i] for i in integral.tolist()])):
+        return column.astype(str)
+    return floats
+
+_float_mark = re.compile(r"[.eEnN]").search
+
+def _parse_floats(values):
+    # float() on a list of python strings is about twice as fast as astype(float) on numpy strings
+    return np.fromiter(map(float, values), dtype=float, count=len(values))
+
+def _as_timestamps(column):
+    try:
+        return _parse_floats(column.tolist())
+    except (TypeError, ValueError):
+        pass
+    if 'pandas' in globals():
+        return pandas.to_datetime(pandas.Series(column), utc=True).astype("int64").to_numpy() / 1e9
+    return np.array([datetime.fromisoformat(str(t)).timestamp() for t in column])
+
+def _split_long_format(timestamps, endpoints, values, as_values):
+    # a dict lookup is faster than np.unique, which sorts all the strings
+    endpoints = endpoints.tolist()
+    codes = {endpoint: i for i, endpoint in enumerate(dict.fromkeys(endpoints))}
+    index = np.fromiter(map(codes.__getitem__, endpoints), dtype=np.intp, count=len(endpoints))
+    order = np.argsort(index, kind="stable")
+    bounds = np.cumsum(np.bincount(index, minlength=len(codes)))
+    series = {}
+    for endpoint, rows in zip(codes, np.split(order, bounds[:-1])):
+        series[str(endpoint)] = (timestamps[rows], as_values(values[rows]))
+    return series
+
+def _read_csv(path):
+    '''
+    Reads all columns of a CSV file as python strings, with the C parser of numpy.
+    '''
+    with open(path, "r", newline="") as open_file:
+        header = next(csv.reader(open_file))
+    with warnings.catch_warnings():
+        # a file with only a header is just empty
+        warnings.simplefilter("ignore", UserWarning)
+        table = np.loadtxt(path, dtype=object, delimiter=",", quotechar='"', comments=None, skiprows=1, ndmin=2, encoding="utf-8")
+    if table.size == 0:
+        table = np.zeros((0, len(header)), dtype=object)
+    if table.shape[1] != len(header):
+        raise ValueError(f"{path} has {table.shape[1]} columns but a header with {len(header)} names")
+    return {name: table[:, i] for i, name in enumerate(header)}
+
+__all__.append("load_series")
+def load_series(path):
+    '''
+    Loads a CSV or Parquet file and returns a dict of endpoint name to (timestamps, values) numpy arrays, sorted by time.
+    The values of Parquet files keep their stored dtype, those of CSV files become floats only if they were written as floats.
+    '''
+    path = Path(path)
+    parquet = path.suffix == ".parquet"
+    if parquet:
+        if not 'pandas' in globals():
+            raise ImportError('pandas not found, required to read parquet files')
+        columns = {name: column.to_numpy() for name, column in pandas.read_parquet(path).items()}
+        as_values = lambda values: values
+    else:
+        columns = _read_csv(path)
+        as_values = _as_values
+
+    timestamps = _as_timestamps(columns.pop("timestamp"))
+    if "endpoint" in columns and "value" in columns:
+        series = _split_long_format(timestamps, columns["endpoint"], columns["value"], as_values)
+    else:
+        series = {}
+        for name, values in columns.items():
+            # empty cells of wide tables are endpoints without a sample at this time
+            if parquet:
+                present = np.asarray(pandas.notna(values), dtype=bool)
+            else:
+                present = np.asarray(values != "", dtype=bool)
+            series[name] = (timestamps[present], as_values(values[present]))
+
+    for name, (t, v) in series.items():
+        if np.any(t[1:] < t[:-1]):
+            order = np.argsort(t, kind="stable")
+            series[name] = (t[order], v[order])
+    return series
+
+__all__.append("resample")
+def resample(timestamps, values, poll_interval_s):
+    '''
+    Returns the values the watchdog would have seen polling every poll_interval_s: the last sample at each poll time.
+    '''
+    poll_times = np.arange(timestamps[0], timestamps[-1] + poll_interval_s / 2, poll_interval_s)
+    index = np.searchsorted(timestamps, poll_times, side="right") - 1
+    return poll_times, values[index]
+
+__all__.append("evaluate_rule")
+def evaluate_rule(timestamps, values, rule):
+    '''
+    Evaluates one check_endpoints entry on a time series.
+
+    Returns the boolean array of samples for which the rule fires and the list of (start, end, n_samples) of the alarm episodes.
+    The end of an episode is the first sample not firing anymore, or None if the alarm is still active at the end of the data.
+    '''
+    fired = np.asarray(compare_array(values, rule["reference"], rule["method"]), dtype=bool)
+    edges = np.diff(fired.astype(np.int8), prepend=0, append=0)
+    starts = np.flatnonzero(edges == 1)
+    stops = np.flatnonzero(edges == -1)
+    episodes = []
+    for start, stop in zip(starts, stops):
+        end = timestamps[stop] if stop < len(timestamps) else None
+        episodes.append((timestamps[start], end, stop - start))
+    return fired, episodes
+
+__all__.append("backtest")
+def backtest(rules, series, poll_interval_s=None):
+    '''
+    Evaluates all rules on the recorded series.
+
+    Returns a list of dicts with the rule, the number of evaluated samples, the number of firing samples (the number of alerts with realert_interval_s 0) and the alarm episodes.
+    '''
+    results = []
+    for rule in rules:
+        if rule["endpoint"] not in series:
+            print(f"No data for endpoint {rule['endpoint']}, skipping", flush=True)
+            continue
+        timestamps, values = series[rule["endpoint"]]
+        if poll_interval_s:
+            timestamps, values = resample(timestamps, values, poll_interval_s)
+        try:
+            fired, episodes = evaluate_rule(timestamps, values, rule)
+        except (TypeError, ValueError) as e:
+            # the live watchdog would report "Could not get endpoint" at every poll
+            print(f"Rule {rule['endpoint']} {rule['method']} {rule['reference']!r} can not be evaluated on the recorded values: {e}", flush=True)
+            results.append({"rule": rule, "samples": len(values), "fired": 0, "episodes": [], "error": str(e)})
+            continue
+        results.append({"rule": rule, "samples": len(values), "fired": int(fired.sum()), "episodes": episodes})
+    return results
+
+def _format_time(timestamp):
+    if timestamp is None:
+        return "(still active)"
+    return datetime.fromtimestamp(timestamp).isoformat(sep=" ", timespec="seconds")
+
+def print_report(results, max_episodes):
+    for result in results:
+        rule = result["rule"]
+        if "error" in result:
+            print(f"{rule['endpoint']} {rule['method']} {rule['reference']}: error {result['error']}", flush=True)
+            continue
+        print(f"{rule['endpoint']} {rule['method']} {rule['reference']}: "
+              f"{len(result['episodes'])} alarms, firing in {result['fired']} of {result['samples']} samples", flush=True)
+        for start, end, n_samples in result["episodes"][:max_episodes]:
+            print(f"    {_format_time(start)} -> {_format_time(end)}  ({n_samples} samples)")
+        if len(result["episodes"]) > max_episodes:
+            print(f"    ... {len(result['episodes']) - max_episodes} more")
+
+def write_episodes(results, path):
+    with open(path, "w", newline="") as open_file:
+        writer = csv.writer(open_file)
+        writer.writerow(["endpoint", "method", "reference", "start", "end", "samples"])
+        for result in results:
+            rule = result["rule"]
+            for start, end, n_samples in result["episodes"]:
+                writer.writerow([rule["endpoint"], rule["method"], rule["reference"], start, "" if end is None else end, n_samples])
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--config", type=str, required=True, help="Path of the watchdog yaml config file.")
+    parser.add_argument("--data", type=str, required=True, nargs="+", help="CSV or Parquet files with the recorded data.")
+    parser.add_argument("--poll-interval", type=float, default=None, help="Evaluate the values the watchdog would have seen polling at this interval, instead of every sample.")
+    parser.add_argument("--output", type=str, default=None, help="Write all alarm episodes to this CSV file.")
+    parser.add_argument("--max-episodes", type=int, default=10, help="Number of alarm episodes printed per rule.")
+    args = parser.parse_args()
+
+    with open(Path(args.config), "r") as open_file:
+        config = yaml.safe_load(open_file.read())
+
+    start = time.perf_counter()
+    series = {}
+    for path in args.data:
+        series.update(load_series(path))
+    loaded = time.perf_counter()
+    results = backtest(config["check_endpoints"] or [], series, args.poll_interval)
+    evaluated = time.perf_counter()
+
+    print_report(results, args.max_episodes)
+    n_samples = sum(len(v) for t, v in series.values())
+    print(f"Loaded {n_samples} samples of {len(series)} endpoints in {loaded - start:.2f} s, evaluated {len(results)} rules in {evaluated - loaded:.2f} s", flush=True)
+    if args.output is not None:
+        write_episodes(results, args.output)
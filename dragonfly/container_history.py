@@ -0,0 +1,63 @@
+'''
+Contains the ContainerHistory class, tracking restarts and health of a docker container over time
+'''
+from collections import deque
+
+__all__ = []
+
+__all__.append("ContainerHistory")
+class ContainerHistory(object):
+    '''
+    Short history of the restart count, start time and health status of one container.
+    It is fed with the attributes docker already returned for containers.list, so no additional inspect calls are needed.
+    Restarts are counted from increases of RestartCount (restart policy) and from changes of StartedAt (manual restarts).
+    '''
+
+    def __init__(self, name, window_s=600, samples=None):
+        '''
+        Args:
+            name (str): name of the container
+            window_s (float): length of the time window the restarts are counted in
+            samples (list): previously saved samples, see to_state
+        '''
+        self.name = name
+        self.window_s = window_s
+        self.samples = deque(tuple(sample) for sample in (samples or []))
+
+    def update(self, attrs, now):
+        '''
+        Adds a sample from the container attributes and drops samples which are no longer needed.
+        '''
+        state = attrs.get("State", {})
+        health = (state.get("Health") or {}).get("Status")
+        sample = (now, int(attrs.get("RestartCount", 0)), state.get("StartedAt"), health)
+        # a sample equal to the last one but for its time adds nothing: the samples mark the changes of the container,
+        # so the history (and its saved state) only changes when the container does
+        if not self.samples or self.samples[-1][1:] != sample[1:]:
+            self.samples.append(sample)
+        # the last sample before the window is kept as the baseline for the first restart in the window
+        while len(self.samples) > 1 and self.samples[1][0] < now - self.window_s:
+            self.samples.popleft()
+
+    @property
+    def health(self):
+        return self.samples[-1][3] if self.samples else None
+
+    def restarts(self):
+        '''
+        Number of restarts seen within the time window.
+        '''
+        restarts = 0
+        for previous, current in zip(list(self.samples)[:-1], list(self.samples)[1:]):
+            restart_count_increase = current[1] - previous[1]
+            if restart_count_increase > 0:
+                restarts += restart_count_increase
+            elif current[2] != previous[2]:
+                restarts += 1
+        return restarts
+
+    def is_crash_looping(self, max_restarts):
+        return self.restarts() >= max_restarts
+
+    def to_state(self):
+        return list(self.samples)
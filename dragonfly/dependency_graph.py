@@ -0,0 +1,126 @@
+'''
+Contains the DependencyGraph class, relating the endpoint checks of the watchdog to the services and containers they depend on
+'''
+import glob
+import re
+from pathlib import Path
+
+import yaml
+
+__all__ = []
+
+def container_runs_service(container_name, service):
+    '''
+    True if the container is named like the service, either exactly or as docker compose names it
+    (<project>-<service>-<index>, or <project>_<service>_<index> by docker-compose v1).
+    Containers named otherwise have to be given in service_containers.
+    '''
+    if container_name == service:
+        return True
+    return re.fullmatch(rf"(.+-{re.escape(service)}-|.+_{re.escape(service)}_)\d+", container_name) is not None
+
+def _container_part(name):
+    # container names are given as <host name>/<container name> by the watchdog
+    return name.split("/", 1)[-1]
+
+def read_service_config(path):
+    '''
+    Reads a dl-serve configuration file and returns its runtime-config.
+    '''
+    with open(Path(path), "r") as open_file:
+        config = yaml.safe_load(open_file.read())
+    return config.get("runtime-config", config)
+
+def log_interval_of(endpoint, service_config):
+    '''
+    Longest time in seconds between two value alerts of an endpoint as configured, None if it does not send any.
+    An entity of a modbus scan group is sent with every scan of its group, other entities at least every max_interval
+    (with conditional logging) or every log_interval.
+    '''
+    scan_groups = service_config.get("scan_groups") or {}
+    if endpoint.get("scan_group") in scan_groups:
+        return float(scan_groups[endpoint["scan_group"]])
+    for key in ["max_interval", "log_interval"]:
+        if endpoint.get(key):
+            return float(endpoint[key])
+    return None
+
+
+__all__.append("DependencyGraph")
+class DependencyGraph(object):
+    '''
+    Graph of container -> service -> endpoint check dependencies.
+    A check declares its service and/or container with the "service" and "container" keys of its entry.
+    Otherwise the service is inferred from the dl-serve configuration files given in service_configs,
+    and the container from the service_containers mapping or from the container names.
+    Containers are named <host name>/<container name>; a container given without host is the first one of that name on any host.
+    '''
+
+    def __init__(self, checks, service_configs=None, service_containers=None):
+        '''
+        Args:
+            checks (list): entries of check_endpoints
+            service_configs (list): paths (or glob patterns) of dl-serve configuration files
+            service_containers (dict): service name to container name (optionally <host name>/<container name>), for containers not named after their service
+        '''
+        self.checks = checks or []
+        self.service_containers = service_containers or {}
+        self.endpoint_services = {}
+        self.endpoint_log_intervals = {}
+        for pattern in service_configs or []:
+            for path in sorted(glob.glob(pattern)):
+                config = read_service_config(path)
+                for endpoint in config.get("endpoints", []) or []:
+                    self.endpoint_services[endpoint["name"]] = config["name"]
+                    self.endpoint_log_intervals[endpoint["name"]] = log_interval_of(endpoint, config)
+        self._container_cache = {}
+
+    def service_of(self, check):
+        return check.get("service", self.endpoint_services.get(check["endpoint"]))
+
+    def log_interval_of(self, check):
+        '''
+        Longest time in seconds between two value alerts of the endpoint of the check, None if it is not known.
+        '''
+        return self.endpoint_log_intervals.get(check["endpoint"])
+
+    def container_of(self, check, container_names):
+        '''
+        Name of the container the check depends on, None if it is not known.
+        '''
+        if "container" in check:
+            return self._resolve(check["container"], container_names)
+        service = self.service_of(check)
+        if service is None:
+            return None
+        if service in self.service_containers:
+            return self._resolve(self.service_containers[service], container_names)
+        if service in self._container_cache and self._container_cache[service] in container_names:
+            return self._container_cache[service]
+        # an exact match wins over compose names, e.g. gauge_60 over mainzdripline3-gauge_60-1
+        for matches in [lambda name: name == service, lambda name: container_runs_service(name, service)]:
+            for name in container_names:
+                if matches(_container_part(name)):
+                    self._container_cache[service] = name
+                    return name
+        return None
+
+    def _resolve(self, container, container_names):
+        if container in container_names or "/" in container:
+            return container
+        for name in container_names:
+            if _container_part(name) == container:
+                return name
+        return container
+
+    def dependents(self, container_names):
+        '''
+        Returns a dict of container name to the list of checks depending on it.
+        '''
+        dependents = {}
+        container_names = list(container_names)
+        for check in self.checks:
+            container = self.container_of(check, container_names)
+            if container is not None:
+                dependents.setdefault(container, []).append(check)
+        return dependents
@@ -0,0 +1,50 @@
+'''
+Contains the DockerHost class, a pooled client connection to one docker daemon monitored by the watchdog
+'''
+import docker
+
+__all__ = []
+
+__all__.append("DockerHost")
+class DockerHost(object):
+    '''
+    Connection to one docker daemon. The client is created lazily and dropped after an error, so it is recreated at the next use.
+    '''
+
+    def __init__(self, name, base_url=None, timeout=10, max_pool_size=4):
+        '''
+        Args:
+            name (str): name of the host used in the alerts
+            base_url (str): url of the docker daemon, e.g. tcp://daq-host-2:2375, None to use the environment (the local socket)
+            timeout (float): timeout of the requests to the daemon in seconds
+            max_pool_size (int): number of pooled connections to the daemon
+        '''
+        self.name = name
+        self.base_url = base_url
+        self.timeout = timeout
+        self.max_pool_size = max_pool_size
+        self.client = None
+        self.future = None
+
+    def connect(self):
+        if self.base_url is None:
+            self.client = docker.from_env(timeout=self.timeout, max_pool_size=self.max_pool_size)
+        else:
+            self.client = docker.DockerClient(base_url=self.base_url, timeout=self.timeout, max_pool_size=self.max_pool_size)
+
+    def disconnect(self):
+        if self.client is not None:
+            try:
+                self.client.close()
+            except Exception:
+                pass
+        self.client = None
+
+    def list_containers(self):
+        if self.client is None:
+            self.connect()
+        try:
+            return self.client.containers.list(all=True)
+        except Exception:
+            self.disconnect()
+            raise
@@ -0,0 +1,177 @@
+'''
+Contains the ObservationSink class, a bounded-memory background writer of the values checked by the watchdog
+'''
+import gzip
+import queue
+import threading
+import time
+from pathlib import Path
+
+import numpy as np
+
+__all__ = []
+
+observation_dtype = np.dtype([("timestamp", "f8"),
+                              ("endpoint", "S64"),
+                              ("value", "f8"),
+                              ("value_text", "S32"),
+                              ("verdict", "i1"),
+                              ])
+
+__all__.append("ObservationSink")
+class ObservationSink(object):
+    '''
+    Collects (timestamp, endpoint, value, verdict) records in preallocated numpy buffers and writes full buffers
+    on a background thread to a gzip compressed file, rotated once it reaches max_file_bytes.
+    Each batch is appended as a npy array, see read_observations.
+
+    Memory is capped at n_buffers buffers of buffer_records records: if the writer falls behind and no buffer is free,
+    the records of the current buffer are dropped (and counted) instead of blocking the caller.
+    '''
+
+    def __init__(self, path, buffer_records=4096, n_buffers=8, flush_interval_s=10, max_file_bytes=64*2**20, max_files=5, compresslevel=6):
+        '''
+        Args:
+            path (str): path of the file, rotated files get the suffixes .1, .2, ...
+            buffer_records (int): number of records per buffer
+            n_buffers (int): number of preallocated buffers, at least 2
+            flush_interval_s (float): a partially filled buffer is written once it is older than this, even if no further record arrives
+            max_file_bytes (int): size of the file at which it is rotated
+            max_files (int): number of rotated files kept in addition to the current one
+            compresslevel (int): gzip compression level
+        '''
+        self.path = Path(path)
+        self.flush_interval_s = flush_interval_s
+        self.max_file_bytes = max_file_bytes
+        self.max_files = max_files
+        self.compresslevel = compresslevel
+        self.written = 0
+        self.dropped = 0
+        self._free = queue.Queue()
+        for i in range(max(2, n_buffers) - 1):
+            self._free.put(np.zeros(buffer_records, dtype=observation_dtype))
+        self._full = queue.Queue()
+        self._buffer = np.zeros(buffer_records, dtype=observation_dtype)
+        self._n = 0
+        self._buffer_start = time.time()
+        self._dropping = False
+        self._lock = threading.Lock()
+        self.path.parent.mkdir(parents=True, exist_ok=True)
+        self._thread = threading.Thread(target=self._write_loop, daemon=True)
+        self._thread.start()
+
+    def record(self, timestamp, endpoint, value, verdict):
+        '''
+        Adds one record, never blocks on the file.
+
+        Args:
+            timestamp (float): seconds since the epoch
+            endpoint (str): name of the endpoint
+            value: checked value, stored as float if possible and always as (truncated) text
+            verdict (int): 1 if the check fired, 0 otherwise
+        '''
+        try:
+            number = float(value)
+        except (TypeError, ValueError):
+            number = np.nan
+        with self._lock:
+            row = self._buffer[self._n]
+            row["timestamp"] = timestamp
+            row["endpoint"] = str(endpoint).encode("utf-8", "replace")[:64]
+            row["value"] = number
+            row["value_text"] = str(value).encode("utf-8", "replace")[:32]
+            row["verdict"] = verdict
+            self._n += 1
+            if self._n == len(self._buffer) or time.time() - self._buffer_start >= self.flush_interval_s:
+                self._hand_off()
+
+    def flush(self):
+        '''
+        Hands the current buffer to the writer, e.g. before a shutdown.
+        '''
+        with self._lock:
+            self._hand_off()
+
+    def _hand_off(self):
+        if self._n == 0:
+            self._buffer_start = time.time()
+            return
+        try:
+            buffer = self._free.get_nowait()
+        except queue.Empty:
+            # the writer is behind and all memory is in use: drop instead of growing or blocking
+            self.dropped += self._n
+            if not self._dropping:
+                print(f"Observation writer is behind, dropping records ({self.dropped} dropped so far)", flush=True)
+                self._dropping = True
+        else:
+            self._full.put((self._buffer, self._n))
+            self._buffer = buffer
+            self._dropping = False
+        self._n = 0
+        self._buffer_start = time.time()
+
+    def _write_loop(self):
+        while True:
+            try:
+                item = self._full.get(timeout=self.flush_interval_s)
+            except queue.Empty:
+                # without new records nothing else hands off a partially filled buffer
+                with self._lock:
+                    if time.time() - self._buffer_start >= self.flush_interval_s:
+                        self._hand_off()
+                continue
+            if item is None:
+                return
+            buffer, n = item
+            try:
+                self._write(buffer[:n])
+                self.written += n
+            except Exception as e:
+                self.dropped += n
+                print(f"Could not write observations to {self.path}: {e}", flush=True)
+            self._free.put(buffer)
+
+    def _write(self, records):
+        # every batch is a separate gzip member, so the file stays readable up to the last complete batch after a crash
+        with gzip.open(self.path, "ab", compresslevel=self.compresslevel) as open_file:
+            np.lib.format.write_array(open_file, records, allow_pickle=False)
+        if self.path.stat().st_size >= self.max_file_bytes:
+            self._rotate()
+
+    def _rotate(self):
+        # path.1 -> path.2 -> ..., the oldest file beyond max_files is overwritten
+        for i in range(self.max_files - 1, 0, -1):
+            older = self.path.with_name(f"{self.path.name}.{i}")
+            if older.exists():
+                older.replace(self.path.with_name(f"{self.path.name}.{i + 1}"))
+        if self.max_files > 0:
+            self.path.replace(self.path.with_name(f"{self.path.name}.1"))
+        else:
+            self.path.unlink()
+
+    def close(self):
+        '''
+        Writes all buffered records and stops the writer thread.
+        '''
+        self.flush()
+        self._full.put(None)
+        self._thread.join()
+
+
+__all__.append("read_observations")
+def read_observations(path):
+    '''
+    Returns all records of an observation file as one numpy structured array.
+    '''
+    batches = []
+    with gzip.open(path, "rb") as open_file:
+        while True:
+            try:
+                batches.append(np.lib.format.read_array(open_file, allow_pickle=False))
+            except (ValueError, EOFError, gzip.BadGzipFile):
+                # end of the file, or a batch truncated by a crash
+                break
+    if not batches:
+        return np.zeros(0, dtype=observation_dtype)
+    return np.concatenate(batches)
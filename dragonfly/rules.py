@@ -0,0 +1,42 @@
+'''
+Comparison semantics of the watchdog check rules, shared by the live WatchDog and the offline backtest
+'''
+import operator
+
+import numpy as np
+
+__all__ = []
+
+__all__.append("comparisons")
+comparisons = {"not_equal": operator.ne,
+               "equal": operator.eq,
+               "lower": operator.lt,
+               "greater": operator.gt,
+               }
+
+def _operator(method):
+    if method not in comparisons:
+        raise ValueError(f"Comparison method {method} is not defined. You can use one of {list(comparisons.keys())}.")
+    return comparisons[method]
+
+__all__.append("compare")
+def compare(value, reference, method):
+    '''
+    True if the rule fires for value. The reference is converted to float for float values and used as is otherwise.
+    '''
+    if type(value) == float: reference = float(reference)
+    return _operator(method)(value, reference)
+
+__all__.append("compare_array")
+def compare_array(values, reference, method):
+    '''
+    Vectorized compare for a numpy array of values, giving the same result as compare for every element.
+    Arrays of floating point values behave like float values in compare. Types numpy does not compare like python
+    (e.g. numbers against a string reference) are compared element by element and raise like compare does.
+    '''
+    operation = _operator(method)
+    if values.dtype.kind == "f":
+        return operation(values, float(reference))
+    if (values.dtype.kind == "U" and isinstance(reference, str)) or (values.dtype.kind in "iu" and type(reference) in [int, float]):
+        return operation(values, reference)
+    return np.fromiter((compare(value, reference, method) for value in values.tolist()), dtype=bool, count=len(values))
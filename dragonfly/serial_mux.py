@@ -0,0 +1,188 @@
+#!/usr/bin/env python3
+'''
+Multiplexer sharing one ethernet-to-serial bridge port between several dripline services.
+
+The multiplexer owns the socket to the device and accepts any number of local client connections.
+Clients send the same framed requests they would send to the device; the multiplexer forwards them one
+at a time, serving the clients round robin, and returns each response to the client which sent the request.
+Services then only need their socket_info pointed at the multiplexer, e.g. for examples/pressure_gauge_60.yaml:
+
+    python3 serial_mux.py --device 10.93.130.113:10001 --listen 127.0.0.1:10001 --codec terminator --terminator '\\r'
+
+and socket_info: ("127.0.0.1", 10001) in the configurations of all services using this port.
+'''
+import argparse
+import asyncio
+import collections
+import itertools
+
+__all__ = []
+
+__all__.append("TerminatorCodec")
+class TerminatorCodec(object):
+    '''
+    Framing of SCPI-like protocols (Pfeiffer, Huber, ...), where requests and responses end with a terminator.
+    '''
+    def __init__(self, command_terminator=b"\r", response_terminator=b"\r"):
+        self.command_terminator = command_terminator
+        self.response_terminator = response_terminator
+
+    async def read_request(self, reader):
+        return await reader.readuntil(self.command_terminator)
+
+    async def read_response(self, reader):
+        return await reader.readuntil(self.response_terminator)
+
+
+__all__.append("ThermoFisherCodec")
+class ThermoFisherCodec(object):
+    '''
+    Framing of the Thermo Fisher protocol used by EthernetThermoFisherService:
+    lead char, two address bytes, command, number of data bytes, data and checksum.
+    '''
+    header_length = 5
+
+    async def _read_frame(self, reader):
+        header = await reader.readexactly(self.header_length)
+        return header + await reader.readexactly(header[-1] + 1)
+
+    async def read_request(self, reader):
+        return await self._read_frame(reader)
+
+    async def read_response(self, reader):
+        return await self._read_frame(reader)
+
+
+__all__.append("SerialMultiplexer")
+class SerialMultiplexer(object):
+    '''
+    Forwards the requests of many local clients to one device, serving the clients round robin.
+    '''
+
+    def __init__(self, device_host, device_port, codec, response_timeout=5., reconnect_delay=1.):
+        '''
+        Args:
+            device_host (str): host of the ethernet-to-serial bridge
+            device_port (int): port of the ethernet-to-serial bridge
+            codec (TerminatorCodec||ThermoFisherCodec): framing of the protocol
+            response_timeout (float): seconds to wait for a response of the device
+            reconnect_delay (float): seconds to wait before reconnecting to the device after an error
+        '''
+        self.device_host = device_host
+        self.device_port = device_port
+        self.codec = codec
+        self.response_timeout = response_timeout
+        self.reconnect_delay = reconnect_delay
+        self.queues = collections.OrderedDict()
+        self.pending = asyncio.Event()
+        self.client_ids = itertools.count()
+        self.device = None
+
+    async def connect_device(self):
+        while self.device is None:
+            try:
+                self.device = await asyncio.open_connection(self.device_host, self.device_port)
+                print(f"Connected to device {self.device_host}:{self.device_port}", flush=True)
+            except OSError as e:
+                print(f"Could not connect to device: {e}", flush=True)
+                await asyncio.sleep(self.reconnect_delay)
+
+    def disconnect_device(self):
+        if self.device is not None:
+            self.device[1].close()
+        self.device = None
+
+    async def handle_client(self, reader, writer):
+        client_id = next(self.client_ids)
+        self.queues[client_id] = collections.deque()
+        print(f"Client {client_id} connected, {len(self.queues)} clients", flush=True)
+        try:
+            while True:
+                request = await self.codec.read_request(reader)
+                response = asyncio.get_running_loop().create_future()
+                self.queues[client_id].append((request, response))
+                self.pending.set()
+                writer.write(await response)
+                await writer.drain()
+        except (asyncio.IncompleteReadError, ConnectionError):
+            pass
+        except Exception as e:
+            print(f"Closing client {client_id}: {e}", flush=True)
+        finally:
+            for request, response in self.queues.pop(client_id):
+                response.cancel()
+            writer.close()
+            print(f"Client {client_id} disconnected, {len(self.queues)} clients", flush=True)
+
+    def next_request(self):
+        '''
+        Takes the next request of the first client with a pending request, and moves that client to the end of the round.
+        '''
+        for client_id, queue in self.queues.items():
+            if queue:
+                self.queues.move_to_end(client_id)
+                return queue.popleft()
+        return None
+
+    async def forward(self, request):
+        await self.connect_device()
+        reader, writer = self.device
+        writer.write(request)
+        await writer.drain()
+        return await asyncio.wait_for(self.codec.read_response(reader), self.response_timeout)
+
+    async def serve_device(self):
+        while True:
+            item = self.next_request()
+            if item is None:
+                self.pending.clear()
+                await self.pending.wait()
+                continue
+            request, response = item
+            if response.cancelled():
+                continue
+            try:
+                result = await self.forward(request)
+            except Exception as e:
+                # a late response would be mixed up with the next request, so the device connection is reset
+                print(f"Request {request!r} failed: {e!r}, reconnecting to device", flush=True)
+                self.disconnect_device()
+                if not response.done():
+                    response.set_exception(ConnectionError(f"device request failed: {e!r}"))
+                await asyncio.sleep(self.reconnect_delay)
+                continue
+            if not response.done():
+                response.set_result(result)
+
+    async def run(self, listen_host, listen_port):
+        await self.connect_device()
+        server = await asyncio.start_server(self.handle_client, listen_host, listen_port)
+        print(f"Listening on {listen_host}:{listen_port}", flush=True)
+        async with server:
+            await asyncio.gather(server.serve_forever(), self.serve_device())
+
+
+def host_port(value):
+    host, port = value.rsplit(":", 1)
+    return host, int(port)
+
+def terminator(value):
+    return value.encode().decode("unicode_escape").encode("latin-1")
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--device", type=host_port, required=True, help="host:port of the ethernet-to-serial bridge.")
+    parser.add_argument("--listen", type=host_port, default=("127.0.0.1", 10001), help="host:port the clients connect to.")
+    parser.add_argument("--codec", choices=["terminator", "thermo_fisher"], default="terminator", help="Framing of the device protocol.")
+    parser.add_argument("--terminator", type=terminator, default=b"\r", help="Terminator of requests for the terminator codec.")
+    parser.add_argument("--response-terminator", type=terminator, default=None, help="Terminator of responses, if different from --terminator.")
+    parser.add_argument("--timeout", type=float, default=5., help="Seconds to wait for a response of the device.")
+    args = parser.parse_args()
+
+    if args.codec == "thermo_fisher":
+        codec = ThermoFisherCodec()
+    else:
+        codec = TerminatorCodec(args.terminator, args.response_terminator or args.terminator)
+    mux = SerialMultiplexer(*args.device, codec, response_timeout=args.timeout)
+    asyncio.run(mux.run(*args.listen))
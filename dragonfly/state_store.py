@@ -0,0 +1,118 @@
+'''
+Contains the StateStore class, a small persistent key-value store used by the watchdog to survive restarts
+'''
+import json
+import os
+import threading
+from pathlib import Path
+
+__all__ = []
+
+__all__.append("StateStore")
+class StateStore(object):
+    '''
+    Key-value store organised in sections (e.g. "alerts", "container_history").
+    Changes are kept in memory and appended as JSON lines to a log file on flush().
+    On load the log is replayed; once it holds many outdated records it is compacted into a fresh file.
+    Without a path the store is purely in memory.
+    '''
+    _deleted = object()
+
+    def __init__(self, path=None, compact_ratio=4):
+        '''
+        Args:
+            path (str): path of the log file, None to not persist anything
+            compact_ratio (int): the log is rewritten once it holds more than compact_ratio records per live entry
+        '''
+        self.path = Path(path) if path is not None else None
+        self.compact_ratio = compact_ratio
+        self.sections = {}
+        self._dirty = {}
+        self._records = 0
+        self._lock = threading.Lock()
+        if self.path is not None:
+            self.load()
+
+    def load(self):
+        if not self.path.exists():
+            return
+        good_offset = 0
+        with open(self.path, "rb") as open_file:
+            for line in open_file:
+                try:
+                    if not line.endswith(b"\n"):
+                        raise ValueError("record without newline")
+                    record = json.loads(line)
+                except ValueError:
+                    # a crash while appending leaves a truncated last line
+                    print(f"Ignoring broken record in state file {self.path}", flush=True)
+                    break
+                good_offset += len(line)
+                self._records += 1
+                if record.get("d"):
+                    self.sections.get(record["s"], {}).pop(record["k"], None)
+                else:
+                    self.sections.setdefault(record["s"], {})[record["k"]] = record["v"]
+        if good_offset < self.path.stat().st_size:
+            # records appended after the broken one would be unreadable, so it is cut off
+            os.truncate(self.path, good_offset)
+        print(f"Loaded {sum(len(s) for s in self.sections.values())} entries from state file {self.path}", flush=True)
+
+    def get(self, section, key, default=None):
+        return self.sections.get(section, {}).get(key, default)
+
+    def items(self, section):
+        return list(self.sections.get(section, {}).items())
+
+    def set(self, section, key, value):
+        with self._lock:
+            entries = self.sections.setdefault(section, {})
+            if key in entries and entries[key] == value:
+                return
+            entries[key] = value
+            self._dirty[(section, key)] = value
+
+    def delete(self, section, key):
+        with self._lock:
+            if key not in self.sections.get(section, {}):
+                return
+            del self.sections[section][key]
+            self._dirty[(section, key)] = self._deleted
+
+    def flush(self):
+        '''
+        Writes all changes since the last flush to disk.
+        '''
+        if self.path is None:
+            return
+        with self._lock:
+            if not self._dirty:
+                return
+            n_live = sum(len(entries) for entries in self.sections.values())
+            if self._records + len(self._dirty) > self.compact_ratio * max(n_live, 16):
+                self._compact()
+            else:
+                with open(self.path, "a") as open_file:
+                    for (section, key), value in self._dirty.items():
+                        if value is self._deleted:
+                            record = {"s": section, "k": key, "d": 1}
+                        else:
+                            record = {"s": section, "k": key, "v": value}
+                        open_file.write(json.dumps(record, default=str) + "\n")
+                    open_file.flush()
+                    os.fsync(open_file.fileno())
+                self._records += len(self._dirty)
+            self._dirty = {}
+
+    def _compact(self):
+        tmp_path = self.path.with_name(self.path.name + ".tmp")
+        records = 0
+        with open(tmp_path, "w") as open_file:
+            for section, entries in self.sections.items():
+                for key, value in entries.items():
+                    open_file.write(json.dumps({"s": section, "k": key, "v": value}, default=str) + "\n")
+                    records += 1
+            open_file.flush()
+            os.fsync(open_file.fileno())
+        os.replace(tmp_path, self.path)
+        self._records = records
@@ -3,42 +3,297 @@ import requests
 import json
 import signal
 import time
-import docker
 import dripline
 import yaml
 from pathlib import Path
 import argparse
+import threading
+import concurrent.futures
+
+from dripline.core import Interface, AlertConsumer
+
+try:
+    from .state_store import StateStore
+    from .container_history import ContainerHistory
+    from .dependency_graph import DependencyGraph
+    from .adaptive_schedule import AdaptiveSchedule
+    from .rules import compare
+    from .docker_hosts import DockerHost
+    from .observation_sink import ObservationSink
+except ImportError:
+    # watchdog.py is executed as a script
+    from state_store import StateStore
+    from container_history import ContainerHistory
+    from dependency_graph import DependencyGraph
+    from adaptive_schedule import AdaptiveSchedule
+    from rules import compare
+    from docker_hosts import DockerHost
+    from observation_sink import ObservationSink
+
+class WatchDogSubscriber(AlertConsumer):
+    '''
+    AlertConsumer handing every received value alert and modbus scan group record to the WatchDog for rule evaluation.
+    '''
+    def __init__(self, watchdog, **kwargs):
+        '''
+        Args:
+            watchdog (WatchDog): instance evaluating the rules on incoming alerts
+        '''
+        self.watchdog = watchdog
+        AlertConsumer.__init__(self, **kwargs)
+
+    def process_payload(self, a_payload, a_routing_key_data, a_message_timestamp):
+        if a_routing_key_data.get("kind") == "scan_group":
+            self.watchdog.on_scan_group_alert(a_routing_key_data["endpoint"], a_payload.to_python())
+        else:
+            self.watchdog.on_alert(a_routing_key_data["endpoint"], a_payload.to_python())
 
-from dripline.core import Interface
 
 class WatchDog(object):
     kill_now = False
 
-    def __init__(self, config_path):
+    def __init__(self, config_path, config=None):
+        '''
+        Args:
+            config_path (str): path of the yaml config file
+            config (dict): configuration to use instead of reading config_path
+        '''
         self.config_path = config_path
-        self.load_configuration()
+        self.load_configuration(config)
+        self.setup_state_store()
+        self.setup_observation_sink()
         self.setup_docker_client()
         self.setup_dripline_connection()
+        self.setup_subscriber()
         signal.signal(signal.SIGINT, self.exit_gracefully)
         signal.signal(signal.SIGTERM, self.exit_gracefully)
         self.send_slack_message("Started alarm system!")
 
-    def load_configuration(self):
-        with open(Path(args.config), "r") as open_file:
-            self.config = yaml.safe_load( open_file.read() )
+    def load_configuration(self, config=None):
+        if config is None:
+            with open(Path(self.config_path), "r") as open_file:
+                self.config = yaml.safe_load( open_file.read() )
+        else:
+            self.config = dict(config)
         
         if not "slack_hook" in self.config.keys():
             self.config["slack_hook"] = None
+        if not "subscribe" in self.config.keys():
+            self.config["subscribe"] = None
+        if not "state_file" in self.config.keys():
+            self.config["state_file"] = None
+        if not "state_flush_interval_s" in self.config.keys():
+            self.config["state_flush_interval_s"] = 60
+        if not "realert_interval_s" in self.config.keys():
+            self.config["realert_interval_s"] = 3600
+        if not "crash_loop_window_s" in self.config.keys():
+            self.config["crash_loop_window_s"] = 600
+        if not "crash_loop_restarts" in self.config.keys():
+            self.config["crash_loop_restarts"] = 3
+        if not "service_configs" in self.config.keys():
+            self.config["service_configs"] = []
+        if not "service_containers" in self.config.keys():
+            self.config["service_containers"] = {}
+        if not "docker_hosts" in self.config.keys():
+            self.config["docker_hosts"] = None
+        if not "observation_file" in self.config.keys():
+            self.config["observation_file"] = None
+        if not "observation_max_file_mb" in self.config.keys():
+            self.config["observation_max_file_mb"] = 64
+        if not "observation_max_files" in self.config.keys():
+            self.config["observation_max_files"] = 5
+        if not "observation_buffers" in self.config.keys():
+            self.config["observation_buffers"] = 8
+
+        self.dependencies = DependencyGraph(self.config["check_endpoints"], self.config["service_configs"], self.config["service_containers"])
+        self.dependents = {}
+        self.down_containers = set()
+
+        # checks without min_interval_s/max_interval_s are polled every check_interval_s
+        self.schedules = []
+        for entry in self.config["check_endpoints"] or []:
+            self.schedules.append(AdaptiveSchedule(entry.get("min_interval_s", self.config["check_interval_s"]),
+                                                   entry.get("max_interval_s", self.config["check_interval_s"]),
+                                                   entry.get("sensitivity", 1.)))
         
         print("Configuration is:", flush=True)
         print(self.config, flush=True)
 
+    def setup_state_store(self):
+        '''
+        The state (active alerts, container histories, poll schedules) is restored from state_file, so that a restart does not re-alert
+        everything and does not poll all checks at once.
+        '''
+        self.state = StateStore(self.config["state_file"])
+        self.last_state_flush = time.time()
+        self.container_histories = {name: ContainerHistory(name, self.config["crash_loop_window_s"], samples)
+                                    for name, samples in self.state.items("container_history")}
+        now = time.time()
+        for entry, schedule in zip(self.config["check_endpoints"] or [], self.schedules):
+            saved = self.state.get("schedules", self.check_key(entry))
+            if saved is not None:
+                schedule.restore(saved, now)
+
+    def save_schedules(self):
+        # the schedules change with every poll, so they are only saved on shutdown
+        for entry, schedule in zip(self.config["check_endpoints"] or [], self.schedules):
+            self.state.set("schedules", self.check_key(entry), schedule.to_state())
+
+    def setup_observation_sink(self):
+        '''
+        With observation_file the checked values are written in batches to a rotating compressed file instead of being printed.
+        '''
+        self.observations = None
+        if self.config["observation_file"] is None:
+            return
+        self.observations = ObservationSink(self.config["observation_file"],
+                                            n_buffers=self.config["observation_buffers"],
+                                            max_file_bytes=int(self.config["observation_max_file_mb"] * 2**20),
+                                            max_files=self.config["observation_max_files"])
+
+    def flush_state(self, force=False):
+        if force or time.time() - self.last_state_flush >= self.config["state_flush_interval_s"]:
+            self.state.flush()
+            self.last_state_flush = time.time()
+
+    def raise_alert(self, key, message):
+        '''
+        Sends message, unless the alert with this key is already active and was sent less than realert_interval_s ago.
+        '''
+        now = time.time()
+        last_sent = self.state.get("alerts", key)
+        if last_sent is not None and now - last_sent < self.config["realert_interval_s"]:
+            return
+        self.state.set("alerts", key, now)
+        self.send_slack_message(message)
+
+    def clear_alert(self, key):
+        self.state.delete("alerts", key)
+
     def setup_docker_client(self):
-        self.client = docker.from_env()
+        '''
+        Without docker_hosts only the local docker daemon is monitored.
+        Otherwise all hosts are listed concurrently, each with its own client; a host which does not reply within its timeout is reported without stalling the others.
+        '''
+        if self.config["docker_hosts"] is None:
+            self.docker_hosts = [DockerHost("local")]
+        else:
+            self.docker_hosts = [DockerHost(**host) for host in self.config["docker_hosts"]]
+        self.docker_pool = concurrent.futures.ThreadPoolExecutor(max_workers=len(self.docker_hosts))
+
+    def container_name(self, host, container):
+        if len(self.docker_hosts) == 1:
+            return container.name
+        return self.qualified_container_name(host, container)
+
+    def qualified_container_name(self, host, container):
+        # containers of the same name on different hosts are different dependencies, even with a single host configured
+        return f"{host.name}/{container.name}"
+
+    def list_containers(self):
+        '''
+        Returns (host, container) of all reachable hosts.
+        '''
+        submitted = []
+        for host in self.docker_hosts:
+            # a host still busy with the list of an earlier sweep does not get a second request, and is not waited for again
+            if host.future is None or host.future.done():
+                host.future = self.docker_pool.submit(host.list_containers)
+                submitted.append(host)
+        done = set()
+        if submitted:
+            timeout = max(host.timeout for host in submitted)
+            done, not_done = concurrent.futures.wait([host.future for host in submitted], timeout=timeout)
+        containers = []
+        for host in self.docker_hosts:
+            if host.future in done and host.future.exception() is None:
+                self.clear_alert(f"docker_host:{host.name}")
+                containers.extend((host, container) for container in host.future.result())
+            else:
+                if host.future in done:
+                    error = host.future.exception()
+                elif host in submitted:
+                    error = f"no reply within {timeout} s"
+                else:
+                    error = "the request of an earlier check is still running"
+                self.raise_alert(f"docker_host:{host.name}", f"Could not list the containers of docker host {host.name}: {error}")
+        return containers
 
     def setup_dripline_connection(self):
         self.connection = Interface(dripline_mesh=self.config["dripline_mesh"])
 
+    def setup_subscriber(self):
+        '''
+        In subscriber mode the endpoint rules are evaluated on the value alerts broadcast by the services instead of polling the endpoints.
+        The records of modbus scan groups (scan_group.<group name>) are split into the values of their entities.
+        '''
+        self.subscriber = None
+        if self.config["subscribe"] is None:
+            return
+        self.checks_by_endpoint = {}
+        for entry in self.config["check_endpoints"] or []:
+            self.checks_by_endpoint.setdefault(entry["endpoint"], []).append(entry)
+        subscribe = self.config["subscribe"]
+        # without polling, a hung service or a lost binding would only make the rules go quiet
+        self.last_alert_times = {}
+        self.subscriber_start = time.time()
+        self.max_silences = []
+        for entry in self.config["check_endpoints"] or []:
+            max_silence = entry.get("max_silence_s", subscribe.get("max_silence_s"))
+            log_interval = self.dependencies.log_interval_of(entry)
+            if max_silence is None and log_interval is not None:
+                max_silence = subscribe.get("max_silence_factor", 3) * log_interval
+            if max_silence is None:
+                print(f"No max_silence_s known for endpoint {entry['endpoint']}, missing alerts of it are not reported", flush=True)
+            self.max_silences.append(max_silence)
+        # the same field must be used by the entities filtering their logs (check_field of Entity)
+        self.check_field = subscribe.get("check_field", "value_raw")
+        self.subscriber = WatchDogSubscriber(self,
+                                             name=subscribe.get("name", "watchdog_subscriber"),
+                                             alert_keys=subscribe.get("alert_keys", ["sensor_value.#", "scan_group.#"]),
+                                             alert_key_parser_re=subscribe.get("alert_key_parser_re", r"(?P<kind>sensor_value|scan_group)\.(?P<endpoint>.+)"),
+                                             dripline_mesh=self.config["dripline_mesh"])
+        self.subscriber_thread = threading.Thread(target=self.listen_for_alerts, daemon=True)
+        self.subscriber_thread.start()
+
+    def listen_for_alerts(self):
+        self.subscriber.start()
+        self.subscriber.listen()
+        self.subscriber.stop()
+
+    def on_alert(self, endpoint, payload):
+        if endpoint not in self.checks_by_endpoint:
+            return
+        try:
+            value = payload[self.check_field]
+        except Exception as e:
+            self.raise_alert(f"endpoint_error:{endpoint}", "Could not check alert of endpoint %s. Got error %s."%(endpoint, str(e) ))
+            return
+        self.on_value(endpoint, value)
+
+    def on_scan_group_alert(self, group, payload):
+        '''
+        The record of a modbus scan group holds the raw values of all entities of the group, they are checked regardless of check_field.
+        '''
+        try:
+            values = payload["values"]
+        except Exception as e:
+            self.raise_alert(f"scan_group_error:{group}", "Could not check alert of scan group %s. Got error %s."%(group, str(e) ))
+            return
+        self.clear_alert(f"scan_group_error:{group}")
+        for endpoint, value in values.items():
+            if endpoint in self.checks_by_endpoint:
+                self.on_value(endpoint, value)
+
+    def on_value(self, endpoint, value):
+        self.last_alert_times[endpoint] = time.time()
+        for entry in self.checks_by_endpoint[endpoint]:
+            try:
+                self.check_value(entry, value)
+                self.clear_alert(f"endpoint_error:{endpoint}")
+            except Exception as e:
+                self.raise_alert(f"endpoint_error:{endpoint}", "Could not check alert of endpoint %s. Got error %s."%(endpoint, str(e) ))
+
     def exit_gracefully(self, signum, frame):
         self.kill_now = True
         print("Got a signal %d"%signum, flush=True)
@@ -60,46 +315,129 @@ class WatchDog(object):
         return val["value_raw" if not calibrated else "value_cal"]
 
     def compare(self, value, reference, method):
-        if type(value) == float: reference = float(reference)
-        if method == "not_equal":
-            return value != reference
-        elif method == "equal":
-            return value == reference
-        elif method == "lower":
-            return value < reference
-        elif method == "greater":
-            return value > reference
+        # the semantics are shared with the offline backtest in backtest.py
+        return compare(value, reference, method)
+
+    def check_key(self, entry):
+        return f"endpoint:{entry['endpoint']}:{entry['method']}:{entry['reference']}"
+
+    def check_value(self, entry, value):
+        if self.observations is None:
+            print(entry["endpoint"], value, flush=True)
+        key = self.check_key(entry)
+        fired = self.compare(value, entry["reference"], entry["method"])
+        if self.observations is not None:
+            self.observations.record(time.time(), entry["endpoint"], value, int(bool(fired)))
+        if fired:
+            self.raise_alert(key, entry["message"].format(**locals()))
         else:
-            raise ValueError(f"Comparison method {method} is not defined. You can use one of ['not_equal', 'equal', 'lower', 'greater'].")
+            self.clear_alert(key)
+        return fired
+
+    def check_container(self, host, container, now):
+        name = self.container_name(host, container)
+        exit_code = int(container.attrs["State"]["ExitCode"])
+        if container.status != "running":
+            qualified_name = self.qualified_container_name(host, container)
+            self.down_containers.add(qualified_name)
+            message = f"Container {name} is not running!"
+            skipped = [entry["endpoint"] for entry in self.dependents.get(qualified_name, [])]
+            if skipped:
+                message += f" Skipping the checks of its endpoints {', '.join(skipped)}."
+            self.raise_alert(f"container_status:{name}", message)
+        else:
+            self.clear_alert(f"container_status:{name}")
+        if exit_code != 0:
+            self.raise_alert(f"container_exit:{name}", f"Container {name} has exit code {exit_code}!")
+        else:
+            self.clear_alert(f"container_exit:{name}")
+
+        # the attributes returned by containers.list are used as they are, a reload() would cost one inspect call per container
+        if name not in self.container_histories:
+            self.container_histories[name] = ContainerHistory(name, self.config["crash_loop_window_s"])
+        history = self.container_histories[name]
+        history.update(container.attrs, now)
+        self.state.set("container_history", name, history.to_state())
+        if history.is_crash_looping(self.config["crash_loop_restarts"]):
+            self.raise_alert(f"container_crash_loop:{name}",
+                             f"Container {name} is in a restart loop, it restarted {history.restarts()} times in the last {self.config['crash_loop_window_s']} s!")
+        else:
+            self.clear_alert(f"container_crash_loop:{name}")
+        if history.health == "unhealthy":
+            self.raise_alert(f"container_health:{name}", f"Container {name} is unhealthy!")
+        else:
+            self.clear_alert(f"container_health:{name}")
+
+    def check_silence(self):
+        '''
+        In subscriber mode, reports the checks of which no alert arrived within their max_silence_s, except the ones served by a container which is down.
+        '''
+        now = time.time()
+        skipped = {entry["endpoint"] for name in self.down_containers for entry in self.dependents.get(name, [])}
+        for entry, max_silence in zip(self.config["check_endpoints"], self.max_silences):
+            if max_silence is None or entry["endpoint"] in skipped:
+                continue
+            silence = now - self.last_alert_times.get(entry["endpoint"], self.subscriber_start)
+            if silence > max_silence:
+                self.raise_alert(f"endpoint_silent:{entry['endpoint']}",
+                                 f"No alert of endpoint {entry['endpoint']} received for {silence:.0f} s (max_silence_s is {max_silence} s)!")
+            else:
+                self.clear_alert(f"endpoint_silent:{entry['endpoint']}")
+
+    def check_containers(self):
+        now = time.time()
+        containers = self.list_containers()
+        self.dependents = self.dependencies.dependents([self.qualified_container_name(host, container) for host, container in containers])
+        self.down_containers = set()
+        for host, container in containers:
+            if self.kill_now: break
+            # blacklist rules apply to the container names on all hosts
+            if any([container.name.startswith(black) for black in self.config["blacklist_containers"]]):
+               continue
+            self.check_container(host, container, now)
+
+    def check_endpoints(self):
+        '''
+        Polls and checks all endpoints which are due, except the ones served by a container which is down.
+        Those would only wait for the dripline timeout, the container alert already reports them.
+        '''
+        skipped = {entry["endpoint"] for name in self.down_containers for entry in self.dependents.get(name, [])}
+        for entry, schedule in zip(self.config["check_endpoints"], self.schedules):
+            if self.kill_now: break
+            now = time.time()
+            if entry["endpoint"] in skipped or not schedule.is_due(now):
+                continue
+            try:
+                value = self.get_endpoint(entry["endpoint"])
+                fired = self.check_value(entry, value)
+                self.clear_alert(f"endpoint_error:{entry['endpoint']}")
+                schedule.update(value, entry["reference"], now, entry["method"], fired)
+            except Exception as e:
+                self.raise_alert(f"endpoint_error:{entry['endpoint']}", "Could not get endpoint %s. Got error %s."%(entry["endpoint"], str(e) ))
+                schedule.postpone(now)
 
     def run(self):
 
+        next_container_check = 0
         while not self.kill_now:
-            if self.config["check_endpoints"] is not None:
-                for entry in self.config["check_endpoints"]:
-                    if self.kill_now: break
-                    try:
-                        value = self.get_endpoint(entry["endpoint"])
-                        print(entry["endpoint"], value, flush=True)
-                        if self.compare(value, entry["reference"], entry["method"]):
-                            self.send_slack_message(entry["message"].format(**locals()))
-                    except Exception as e:
-                        self.send_slack_message("Could not get endpoint %s. Got error %s."%(entry["endpoint"], str(e) ))
-
-
-            for container in self.client.containers.list(all=True):
-                if self.kill_now: break
-                if any([container.name.startswith(black) for black in self.config["blacklist_containers"]]):
-                   continue
-                if container.status != "running":
-                    self.send_slack_message(f"Container {container.name} is not running!")
-                if int(container.attrs["State"]["ExitCode"]) != 0:
-                    self.send_slack_message(f"Containeri {container.name} has exit code {container.attrs['State']['ExitCode']}!")
-        
-            print("Checks done", flush=True)
-            for i in range(int(self.config["check_interval_s"])):
-                if self.kill_now: break
-                time.sleep(1)
+            if time.time() >= next_container_check:
+                # containers are checked first, so that the endpoints of containers which are down can be skipped
+                self.check_containers()
+                next_container_check = time.time() + self.config["check_interval_s"]
+                print("Checks done", flush=True)
+
+            if self.config["check_endpoints"] is not None and self.subscriber is None:
+                self.check_endpoints()
+            elif self.config["check_endpoints"] is not None:
+                self.check_silence()
+
+            self.flush_state()
+            time.sleep(1)
+        self.save_schedules()
+        self.flush_state(force=True)
+        if self.observations is not None:
+            self.observations.close()
+        self.docker_pool.shutdown(wait=False)
         self.send_slack_message(f"Stopping alarm system")
 
 
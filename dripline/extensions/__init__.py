@@ -8,6 +8,8 @@ from . import jitter
 # Modules in this directory
 
 from .add_auth_spec import *
+from .write_behind import *
+from .calibration_table import *
 from .cmd_endpoint import *
 from .asteval_endpoint import *
 from .thermo_fisher_endpoint import *
@@ -0,0 +1,136 @@
+'''
+Contains the CalibrationTable class and the table_calibrate decorator, for calibrations given as breakpoint tables
+'''
+
+try:
+    import numpy as np
+except ImportError:
+    pass
+
+import functools
+from pathlib import Path
+
+from dripline.core import calibrate
+
+import logging
+logger = logging.getLogger(__name__)
+
+__all__ = []
+
+__all__.append('CalibrationTable')
+class CalibrationTable(object):
+    '''
+    Calibration from a table of (raw, calibrated) breakpoints, e.g. a thermistor curve or a flowmeter table.
+    The table is read once and kept as numpy arrays; values are looked up with searchsorted and interpolated
+    piecewise linearly or with a natural cubic spline. Scalars and whole arrays of values can be calibrated.
+    '''
+
+    def __init__(self, path, interpolation='linear', out_of_range='nan'):
+        '''
+        Args:
+            path (str): text file with two columns (raw, calibrated), comma or whitespace separated; lines starting with # are ignored
+            interpolation (str): either 'linear' or 'spline'
+            out_of_range (str): result for raw values outside of the table: 'nan', 'clip' to the first/last calibrated value or 'extrapolate'
+        '''
+        if not 'np' in globals():
+            raise ImportError('numpy not found, required for CalibrationTable class')
+        if interpolation not in ['linear', 'spline']:
+            raise ValueError(f"Invalid interpolation <{interpolation}>, expect 'linear' or 'spline'")
+        if out_of_range not in ['nan', 'clip', 'extrapolate']:
+            raise ValueError(f"Invalid out_of_range <{out_of_range}>, expect 'nan', 'clip' or 'extrapolate'")
+        self.path = path
+        self.interpolation = interpolation
+        self.out_of_range = out_of_range
+
+        table = np.loadtxt(Path(path), delimiter=',' if Path(path).suffix == '.csv' else None, comments='#', ndmin=2)
+        if table.shape[1] != 2 or table.shape[0] < 2:
+            raise ValueError(f'calibration table {path} must have two columns and at least two rows')
+        order = np.argsort(table[:, 0])
+        self.x = np.ascontiguousarray(table[order, 0])
+        self.y = np.ascontiguousarray(table[order, 1])
+        if np.any(np.diff(self.x) <= 0):
+            raise ValueError(f'raw values of calibration table {path} are not unique')
+        self.slopes = np.diff(self.y) / np.diff(self.x)
+        if interpolation == 'spline':
+            self.curvatures = self._natural_spline_curvatures()
+        logger.debug(f'loaded calibration table {path} with {len(self.x)} breakpoints')
+
+    def _natural_spline_curvatures(self):
+        '''
+        Second derivatives of the natural cubic spline at the breakpoints, solved once with the Thomas algorithm.
+        '''
+        n = len(self.x)
+        curvatures = np.zeros(n)
+        if n < 3:
+            return curvatures
+        h = np.diff(self.x)
+        lower = h[1:-1].copy()
+        diagonal = 2. * (h[:-1] + h[1:])
+        rhs = 6. * np.diff(self.slopes)
+        for i in range(1, n - 2):
+            factor = lower[i - 1] / diagonal[i - 1]
+            diagonal[i] -= factor * h[i]
+            rhs[i] -= factor * rhs[i - 1]
+        inner = np.zeros(n - 2)
+        inner[-1] = rhs[-1] / diagonal[-1]
+        for i in range(n - 4, -1, -1):
+            inner[i] = (rhs[i] - h[i + 1] * inner[i + 1]) / diagonal[i]
+        curvatures[1:-1] = inner
+        return curvatures
+
+    def evaluate(self, raw):
+        '''
+        Calibrates a numpy array of raw values.
+        '''
+        raw = np.asarray(raw, dtype=float)
+        if self.out_of_range == 'clip':
+            lookup = np.clip(raw, self.x[0], self.x[-1])
+        else:
+            lookup = raw
+        segment = np.clip(np.searchsorted(self.x, lookup, side='right') - 1, 0, len(self.x) - 2)
+        dx = lookup - self.x[segment]
+        result = self.y[segment] + self.slopes[segment] * dx
+        if self.interpolation == 'spline':
+            h = self.x[segment + 1] - self.x[segment]
+            m0 = self.curvatures[segment]
+            m1 = self.curvatures[segment + 1]
+            result += dx * (dx - h) * ((2. * m0 + m1) + (m1 - m0) * dx / h) / 6.
+        if self.out_of_range == 'nan':
+            result = np.where((raw < self.x[0]) | (raw > self.x[-1]), np.nan, result)
+        return result
+
+    def __call__(self, raw):
+        '''
+        Calibrates a scalar or a list of raw values, returning python types.
+        '''
+        return self.evaluate(raw).tolist()
+
+
+_loaded_tables = {}
+
+__all__.append('load_calibration_table')
+def load_calibration_table(path, interpolation='linear', out_of_range='nan'):
+    '''
+    Returns the CalibrationTable for path, reading the file only once even if several entities use it.
+    '''
+    key = (str(Path(path).resolve()), interpolation, out_of_range)
+    if key not in _loaded_tables:
+        _loaded_tables[key] = CalibrationTable(path, interpolation, out_of_range)
+    return _loaded_tables[key]
+
+__all__.append('table_calibrate')
+def table_calibrate(cal_functions=None):
+    '''
+    Replacement of the dripline calibrate decorator for entities with a calibration_table attribute.
+    If the attribute is set the raw value is calibrated with the table, otherwise calibrate is used as usual.
+    '''
+    def decorator(fun):
+        calibrated = calibrate(cal_functions)(fun)
+        @functools.wraps(fun)
+        def wrapper(self, *args, **kwargs):
+            if getattr(self, 'calibration_table', None) is None:
+                return calibrated(self, *args, **kwargs)
+            value_raw = fun(self, *args, **kwargs)
+            return {'value_raw': value_raw, 'value_cal': self.calibration_table(value_raw)}
+        return wrapper
+    return decorator
@@ -1,4 +1,7 @@
-from dripline.core import Entity
+import re
+import time
+
+from dripline.core import Entity, ThrowReply
 
 import logging
 logger = logging.getLogger(__name__)
@@ -26,3 +29,69 @@ class CmdEntity(Entity):
     def cmd(self):
         logger.debug("in cmd function")
         return self.service.send_to_device([self.cmd_str])
+
+__all__.append('CmdMacroEntity')
+class CmdMacroEntity(Entity):
+    '''
+    Entity executing an ordered sequence of device commands as one cmd, e.g. zero, auto-calibrate and enable.
+    The device is held for the whole sequence, so no other request of the service is interleaved.
+    Consecutive steps without delay are sent as one batch; per-step results are returned.
+    '''
+    def __init__(self, steps=None, abort_on_failure=True, **kwargs):
+        '''
+        Args:
+            steps (list): commands in order, each either a command string or a dict with
+                cmd (str): sent verbatim
+                delay_s (float): seconds to wait after this step before sending the next one
+                expect (str): regular expression the stripped reply must match for the step to succeed
+            abort_on_failure (bool): stop the sequence at the first step whose reply does not match its expect
+        '''
+        Entity.__init__(self, **kwargs)
+        if not steps:
+            raise ValueError("steps is required for CmdMacroEntity")
+        self.steps = []
+        for step in steps:
+            if isinstance(step, str):
+                step = {'cmd': step}
+            if not 'cmd' in step:
+                raise ValueError(f"step {step} of CmdMacroEntity has no cmd")
+            self.steps.append({'cmd': step['cmd'],
+                               'delay_s': float(step.get('delay_s', 0)),
+                               'expect': re.compile(step['expect']) if step.get('expect') is not None else None})
+        self.abort_on_failure = abort_on_failure
+
+    def _batches(self):
+        '''
+        Splits the steps into batches sent without interruption: a batch ends at a delay, or at a step whose reply decides about aborting.
+        '''
+        batch = []
+        for step in self.steps:
+            batch.append(step)
+            if step['delay_s'] > 0 or (self.abort_on_failure and step['expect'] is not None):
+                yield batch
+                batch = []
+        if batch:
+            yield batch
+
+    def cmd(self):
+        logger.debug("in cmd function")
+        results = []
+        # the lock of the service is held for the whole sequence, so send_to_device of other entities waits
+        with self.service.alock:
+            for batch in self._batches():
+                try:
+                    replies = self.service._send_commands([step['cmd'] for step in batch])
+                except Exception as err:
+                    # the state of the device connection is unknown, resending could repeat commands
+                    self.service._reconnect()
+                    raise ThrowReply('device_error_connection', f"command sequence failed after {len(results)} steps: {err}")
+                for step, reply in zip(batch, replies):
+                    ok = step['expect'] is None or step['expect'].fullmatch(reply.strip()) is not None
+                    results.append({'cmd': step['cmd'], 'reply': reply, 'ok': ok})
+                if self.abort_on_failure and not results[-1]['ok']:
+                    logger.warning(f"aborting command sequence, reply {results[-1]['reply']!r} to {results[-1]['cmd']!r} not as expected")
+                    break
+                if batch[-1]['delay_s'] > 0 and len(results) < len(self.steps):
+                    time.sleep(batch[-1]['delay_s'])
+        return {'ok': len(results) == len(self.steps) and all(result['ok'] for result in results),
+                'steps': results}
@@ -1,6 +1,7 @@
 import time
 
-from dripline.core import ThrowReply, Entity, calibrate
+from dripline.core import ThrowReply, Entity
+from .calibration_table import load_calibration_table, table_calibrate
 from dripline.implementations import EthernetSCPIService
 
 import logging
@@ -119,11 +120,24 @@ class HuberGetEntity(Entity):
                  offset=0,
                  nbytes=-1,
                  numeric=False,
+                 calibration_table=None,
+                 table_interpolation='linear',
+                 table_out_of_range='nan',
                  **kwargs):
         '''
         Args:
             get_str: hexstring of the command, e.g. 20
+            calibration_table (str): path of a breakpoint table used instead of calibration, requires numeric
+            table_interpolation (str): 'linear' or 'spline' interpolation of the calibration_table
+            table_out_of_range (str): 'nan', 'clip' or 'extrapolate' for raw values outside of the calibration_table
         '''
+        if calibration_table is not None and kwargs.get('calibration') is not None:
+            raise ValueError('calibration and calibration_table are mutually exclusive')
+        if calibration_table is not None and not numeric:
+            raise ValueError('calibration_table requires numeric')
+        self.calibration_table = None
+        if calibration_table is not None:
+            self.calibration_table = load_calibration_table(calibration_table, table_interpolation, table_out_of_range)
         if get_str is None:
             raise ValueError('<get_str is required to __init__ HuberGetEntity instance')
         else:
@@ -139,7 +153,7 @@ class HuberGetEntity(Entity):
             val = val - int("FFFF", 16) - 1
         return val/100.
 
-    @calibrate()
+    @table_calibrate()
     def on_get(self):
         # setup cmd here
         to_send = [self.get_str]
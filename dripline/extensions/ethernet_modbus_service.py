@@ -4,7 +4,20 @@ try:
 except ImportError:
     pass
 
-from dripline.core import calibrate, Entity, Service, ThrowReply
+try:
+    import numpy as np
+except ImportError:
+    pass
+
+import datetime
+import functools
+import threading
+
+import scarab
+
+from dripline.core import calibrate, Entity, MsgAlert, Service, ThrowReply
+from .write_behind import WriteBehindQueue
+from .calibration_table import load_calibration_table, table_calibrate
 
 import logging
 logger = logging.getLogger(__name__)
@@ -12,6 +25,64 @@ logger = logging.getLogger(__name__)
 __all__ = []
 
 
+__all__.append('ModbusBitMap')
+class ModbusBitMap(object):
+    '''
+    States of a contiguous range of coils (0x01) or discrete inputs (0x02), e.g. the interlock and valve states of a PLC.
+    The states are kept in a numpy bool array which is updated as a whole by one bulk read; the bits which changed with the last update are tracked.
+    '''
+    max_bits_per_read = 2000
+
+    def __init__(self, name, start, count, reg_type=0x02, refresh_interval=None):
+        '''
+        Args:
+            name (str): name of the bit map
+            start (int): address of the first bit
+            count (int): number of bits
+            reg_type (hex): either 0x01 for coils or 0x02 for discrete inputs
+            refresh_interval (float): seconds between the scheduled refreshes which log the changed bits, None to only refresh on demand
+        '''
+        if reg_type not in [0x01, 0x02]:
+            raise ValueError(f'Invalid reg_type <{reg_type}> of bit map <{name}>, expect 0x01 or 0x02')
+        self.name = name
+        self.start = start
+        self.count = count
+        self.reg_type = reg_type
+        self.refresh_interval = refresh_interval
+        self.states = np.zeros(count, dtype=bool)
+        self.changed = np.zeros(0, dtype=np.intp)
+        self.timestamp = None
+
+    def update(self, bits, timestamp):
+        '''
+        Stores new states and returns the addresses of the bits which changed. Everything counts as changed on the first update.
+        '''
+        states = np.asarray(bits[:self.count], dtype=bool)
+        if self.timestamp is None:
+            self.changed = np.arange(self.count)
+        else:
+            self.changed = np.flatnonzero(states != self.states)
+        self.states = states
+        self.timestamp = timestamp
+        return self.changed + self.start
+
+    def contains(self, address):
+        return 0 <= address - self.start < self.count
+
+    def bit(self, address):
+        if not self.contains(address):
+            # a negative index would silently return another bit
+            raise ThrowReply('message_error_invalid_value', f'address {address} is not in bit map <{self.name}> ({self.start} to {self.start + self.count - 1})')
+        return bool(self.states[address - self.start])
+
+    def age(self, now):
+        return None if self.timestamp is None else (now - self.timestamp).total_seconds()
+
+    @property
+    def packed(self):
+        return np.packbits(self.states, bitorder='little').tobytes()
+
+
 __all__.append('EthernetModbusService')
 class EthernetModbusService(Service):
     '''
@@ -21,6 +92,11 @@ class EthernetModbusService(Service):
                  ip_address,
                  indexing='protocol',
                  wordorder = "big",
+                 scan_groups = None,
+                 scan_group_routing_key_prefix = 'scan_group',
+                 scan_max_gap = 4,
+                 bit_maps = None,
+                 bit_map_routing_key_prefix = 'bit_map',
                  **kwargs
                  ):
         '''
@@ -28,6 +104,12 @@ class EthernetModbusService(Service):
             ip_address (str): properly formatted ip address of Modbus device
             indexing (int, str): address indexing used by device
             wordorder (["big", "littel"])
+            scan_groups (dict): scan group name to scan interval in seconds; entities join a group with their scan_group option
+            scan_group_routing_key_prefix (str): the record of a group ({'timestamp', 'values': {entity name: raw value}}) is sent as alert with routing key <prefix>.<group name>;
+                it must differ from the sensor_value prefix of the single-value logs of Entity, whose payload has another shape
+            scan_max_gap (int): max number of unused registers read to merge the registers of two entities into one request
+            bit_maps (dict): bit map name to a dict of ModbusBitMap arguments (start, count, reg_type, refresh_interval); changes found by scheduled refreshes are sent as alert with routing key <bit_map_routing_key_prefix>.<bit map name>
+            bit_map_routing_key_prefix (str): prefix of the routing key of the bit map changes ({'timestamp', 'changed': {address: bit}})
         '''
         if not 'pymodbus' in globals():
             raise ImportError('pymodbus not found, required for EthernetModbusService class')
@@ -49,29 +131,153 @@ class EthernetModbusService(Service):
 
         self.wordorder = wordorder
         self.client = ModbusTcpClient(self.ip)
+        # the client is not thread-safe: requests, scheduled scans and delayed write-behind sets share it
+        self.client_lock = threading.RLock()
         self._reconnect()
 
+        self.scan_groups = scan_groups or {}
+        self.scan_group_routing_key_prefix = scan_group_routing_key_prefix
+        self.bit_map_routing_key_prefix = bit_map_routing_key_prefix
+        self.scan_max_gap = scan_max_gap
+        self._scan_action_ids = {}
+        self.bit_maps = {}
+        for name, bit_map in (bit_maps or {}).items():
+            if not 'np' in globals():
+                raise ImportError('numpy not found, required for bit_maps of EthernetModbusService')
+            self.bit_maps[name] = ModbusBitMap(name, **bit_map)
+        self.start_scan_groups()
+
+    def start_scan_groups(self):
+        # scan groups and bit maps may share a name, so their actions are kept under distinct keys
+        for group, interval in self.scan_groups.items():
+            if ('scan_group', group) in self._scan_action_ids:
+                self.unschedule(self._scan_action_ids[('scan_group', group)])
+            logger.info(f'scanning group <{group}> every {interval} s')
+            self._scan_action_ids[('scan_group', group)] = self.schedule(functools.partial(self.scan_group, group),
+                                                                         datetime.timedelta(seconds=interval),
+                                                                         datetime.datetime.now() + self.execution_buffer*3)
+        for name, bit_map in self.bit_maps.items():
+            if bit_map.refresh_interval is None:
+                continue
+            if ('bit_map', name) in self._scan_action_ids:
+                self.unschedule(self._scan_action_ids[('bit_map', name)])
+            logger.info(f'scanning bit map <{name}> every {bit_map.refresh_interval} s')
+            self._scan_action_ids[('bit_map', name)] = self.schedule(functools.partial(self.scan_bit_map, name),
+                                                                     datetime.timedelta(seconds=bit_map.refresh_interval),
+                                                                     datetime.datetime.now() + self.execution_buffer*3)
+
+    def stop_scan_groups(self):
+        for action_id in self._scan_action_ids.values():
+            self.unschedule(action_id)
+        self._scan_action_ids = {}
+
+    def scan_group_entities(self, group):
+        return [child for child in self.sync_children.values() if getattr(child, 'scan_group', None) == group]
+
+    def coalesce_reads(self, entities):
+        '''
+        Combines the registers of entities into as few read requests as possible.
+        Entities with the same register type are merged if at most scan_max_gap unused registers are between them and the request stays within the modbus limit of 125 registers.
+
+        Returns a list of (reg_type, first register, number of registers, [entities]) tuples.
+        '''
+        blocks = []
+        for entity in sorted(entities, key=lambda e: (e.reg_type, e.register)):
+            end = entity.register + entity.n_reg
+            if blocks:
+                reg_type, start, n_reg, members = blocks[-1]
+                if (reg_type == entity.reg_type
+                        and entity.register <= start + n_reg + self.scan_max_gap
+                        and max(end, start + n_reg) - start <= 125):
+                    blocks[-1] = (reg_type, start, max(end, start + n_reg) - start, members + [entity])
+                    continue
+            blocks.append((entity.reg_type, entity.register, entity.n_reg, [entity]))
+        return blocks
+
+    def scan_group(self, group):
+        '''
+        Reads all entities of a scan group with coalesced requests and sends their values as a single timestamped alert.
+        '''
+        timestamp = datetime.datetime.now(datetime.timezone.utc).isoformat()
+        values = {}
+        for reg_type, start, n_reg, members in self.coalesce_reads(self.scan_group_entities(group)):
+            try:
+                registers = self.read_register(start, n_reg, reg_type)
+            except ThrowReply as e:
+                logger.warning(f'scan of group <{group}> failed for registers {start}-{start+n_reg-1}: {e}')
+                continue
+            if n_reg == 1:
+                registers = [registers]
+            for entity in members:
+                offset = entity.register - start
+                try:
+                    values[entity.name] = entity.on_scan(registers[offset:offset+entity.n_reg])
+                except Exception as e:
+                    logger.warning(f'failed to decode <{entity.name}> in scan of group <{group}>: {e}')
+        logger.info(f'scan of group <{group}> returned {values}')
+        the_alert = MsgAlert.create(payload=scarab.to_param({'timestamp': timestamp, 'values': values}),
+                                    routing_key=f'{self.scan_group_routing_key_prefix}.{group}')
+        self.send(the_alert)
+        return values
+
+    def refresh_bit_map(self, name):
+        '''
+        Reads the whole range of a bit map with one request (split only beyond the modbus limit of 2000 bits) and returns the addresses of the changed bits.
+        '''
+        bit_map = self.bit_maps[name]
+        bits = []
+        for start in range(bit_map.start, bit_map.start + bit_map.count, bit_map.max_bits_per_read):
+            count = min(bit_map.max_bits_per_read, bit_map.start + bit_map.count - start)
+            result = self.read_register(start, count, bit_map.reg_type)
+            bits.extend(result if isinstance(result, list) else [result])
+        return bit_map.update(bits, datetime.datetime.now(datetime.timezone.utc))
+
+    def scan_bit_map(self, name):
+        '''
+        Refreshes a bit map and sends the states of the bits which changed as one alert.
+        '''
+        changed = self.refresh_bit_map(name)
+        if len(changed) == 0:
+            return
+        bit_map = self.bit_maps[name]
+        record = {'timestamp': bit_map.timestamp.isoformat(),
+                  'changed': {str(address): bit_map.bit(address) for address in changed.tolist()}}
+        logger.info(f'bits changed in bit map <{name}>: {record["changed"]}')
+        the_alert = MsgAlert.create(payload=scarab.to_param(record),
+                                    routing_key=f'{self.bit_map_routing_key_prefix}.{name}')
+        self.send(the_alert)
+
     def _reconnect(self):
         '''
         Minimal connection method.
         '''
-        if self.client.connected:
-            self.client.close()
+        with self.client_lock:
+            if self.client.connected:
+                self.client.close()
 
-        if self.client.connect():
-            logger.debug('Connected to Device.')
-        else:
-            raise ThrowReply('resource_error_connection','Failed to Connect to Device')
+            if self.client.connect():
+                logger.debug('Connected to Device.')
+            else:
+                raise ThrowReply('resource_error_connection','Failed to Connect to Device')
 
     def _read_register_attempt(self, register, n_reg, reg_type=0x04):
         result = None
         
-        if reg_type == 0x03:
+        if reg_type == 0x01:
+            result = self.client.read_coils(register + self.offset, count=n_reg)
+        elif reg_type == 0x02:
+            result = self.client.read_discrete_inputs(register + self.offset, count=n_reg)
+        elif reg_type == 0x03:
             result = self.client.read_holding_registers(register + self.offset, count=n_reg)
         elif reg_type == 0x04:
             result = self.client.read_input_registers(register + self.offset, count=n_reg)
+        else:
+            raise ValueError(f'Unsupported reg_type <{reg_type}>')
 
-        logger.info('Device returned {}'.format(result.registers))
+        if reg_type in [0x01, 0x02]:
+            logger.info('Device returned {} bits'.format(len(result.bits)))
+        else:
+            logger.info('Device returned {}'.format(result.registers))
         return result
 
 
@@ -79,26 +285,32 @@ class EthernetModbusService(Service):
         '''
         n_reg determines the num of registers needed to express values. More n_reg are needed for higher accuracy values.
         reg_type: Lookup the endpoint code types that your device can access and specify in the code. 
+        For coils (0x01) and discrete inputs (0x02) n_reg is the number of bits and bools are returned.
 
         Expand as desired according to other calls in https://pymodbus.readthedocs.io/en/latest/source/client.html#modbus-calls
         '''
         logger.debug('Reading {} registers starting with {}'.format(n_reg, register))
 
-        try:
-            result = self._read_register_attempt(register, n_reg, reg_type)
-        except Exception as e: 
-            logger.debug(f'read registers failed: {e}. Attempting reconnect.')
-            self._reconnect()
+        with self.client_lock:
             try:
                 result = self._read_register_attempt(register, n_reg, reg_type)
             except Exception as e: 
-                raise ThrowReply('resource_error_query', 'Query data failed')
-
+                logger.debug(f'read registers failed: {e}. Attempting reconnect.')
+                self._reconnect()
+                try:
+                    result = self._read_register_attempt(register, n_reg, reg_type)
+                except Exception as e: 
+                    raise ThrowReply('resource_error_query', 'Query data failed')
 
+        if reg_type in [0x01, 0x02]:
+            # bits are returned padded to full bytes
+            values = list(result.bits[:n_reg])
+        else:
+            values = result.registers
         if n_reg == 1:
-            return result.registers[0]
+            return values[0]
         else:
-            return result.registers
+            return values
 
     def _write_register_attempt(self, register, value):
         response = None
@@ -114,15 +326,16 @@ class EthernetModbusService(Service):
         '''
         logger.debug('writing {} to register {}'.format(value, register))   
 
-        try:
-            self._write_register_attempt(register, value)
-        except Exception as e:
-            logger.debug(f'write_registers failed: {e}. Attempting reconnect.')
-            self._reconnect()
+        with self.client_lock:
             try:
                 self._write_register_attempt(register, value)
-            except:
-                raise ThrowReply('resource_error_write','Failed to write register')
+            except Exception as e:
+                logger.debug(f'write_registers failed: {e}. Attempting reconnect.')
+                self._reconnect()
+                try:
+                    self._write_register_attempt(register, value)
+                except:
+                    raise ThrowReply('resource_error_write','Failed to write register')
 
 __all__.append('ModbusEntity')
 class ModbusEntity(Entity):
@@ -148,33 +361,76 @@ class ModbusEntity(Entity):
                  n_reg = 1,
                  data_type = None,
                  reg_type = 0x04,
+                 scan_group = None,
+                 write_behind = False,
+                 max_write_rate = None,
+                 calibration_table = None,
+                 table_interpolation = 'linear',
+                 table_out_of_range = 'nan',
                  **kwargs):
         '''
         Args:
             register (int): address to read from
             n_reg (int): number of registers needed to read
             data_type (str): the data type being read from the registers
-            reg_type (hex): either 0x04 for input registers or 0x03 for holding registers
+            reg_type (hex): 0x04 for input registers, 0x03 for holding registers, 0x02 for discrete inputs or 0x01 for coils
+            scan_group (str): name of the service scan group this entity is read and logged with
+            write_behind (bool): if True, rapid successive sets are coalesced and only the latest value is written; an error of a delayed write is raised by the next set
+            max_write_rate (float): maximum number of writes per second in write_behind mode, required with write_behind
+            calibration_table (str): path of a breakpoint table used instead of calibration, applied to every value of multi-register reads
+            table_interpolation (str): 'linear' or 'spline' interpolation of the calibration_table
+            table_out_of_range (str): 'nan', 'clip' or 'extrapolate' for raw values outside of the calibration_table
         '''
+        if calibration_table is not None and kwargs.get('calibration') is not None:
+            raise ValueError('calibration and calibration_table are mutually exclusive')
+        self.calibration_table = None
+        if calibration_table is not None:
+            self.calibration_table = load_calibration_table(calibration_table, table_interpolation, table_out_of_range)
         self.register = register
         self.n_reg = n_reg
         self.reg_type = reg_type
         self.data_type = data_type
+        self.scan_group = scan_group
         Entity.__init__(self, **kwargs)
+        if self.scan_group is not None and self.log_interval:
+            logger.warning(f'<{self.name}> is in scan group <{self.scan_group}> and also has a log_interval, it will be logged twice')
+        self._write_queue = None
+        if write_behind:
+            self._write_queue = WriteBehindQueue(self.write_value, max_rate=max_write_rate, name=self.name)
 
-    @calibrate()
+    def decode(self, registers):
+        if self.data_type in self.dtype_map:
+            if not isinstance(registers, list):
+                registers = [registers]
+            return ModbusTcpClient.convert_from_registers(registers, self.dtype_map[self.data_type], word_order=self.service.wordorder)
+        if isinstance(registers, list) and self.n_reg == 1:
+            return registers[0]
+        return registers
+
+    @table_calibrate()
     def on_get(self):
         result = self.service.read_register(self.register, self.n_reg, self.reg_type)
-        if self.data_type in self.dtype_map:
-            result = ModbusTcpClient.convert_from_registers(result, self.dtype_map[self.data_type], word_order=self.service.wordorder)
+        result = self.decode(result)
         logger.info('Decoded result for <{}> is {}'.format(self.name, result))
         return result
 
-    def on_set(self, value):
+    @table_calibrate()
+    def on_scan(self, registers):
+        '''
+        Decodes this entity's slice of the registers of a scan group read
+        '''
+        return self.decode(registers)
+
+    def write_value(self, value):
         if self.data_type in self.dtype_map:
             value = ModbusTcpClient.convert_to_registers(value, self.dtype_map[self.data_type], word_order=self.service.wordorder)
         return self.service.write_register(self.register, value)
 
+    def on_set(self, value):
+        if self._write_queue is not None:
+            return self._write_queue.submit(value)
+        return self.write_value(value)
+
 __all__.append('ModbusGetEntity')
 class ModbusGetEntity(ModbusEntity): 
     '''
@@ -197,3 +453,40 @@ class ModbusSetEntity(ModbusEntity):
     @calibrate()
     def on_get(self, valuei):
         raise ThrowReply('message_error_invalid_method', f"endpoint '{self.name}' does not support set")
+
+__all__.append('ModbusBitEntity')
+class ModbusBitEntity(Entity):
+    '''
+    Entity for one coil or discrete input of a bit map of the EthernetModbusService.
+    The whole bit map is read with one request when its states are older than max_age, so reading many bit entities costs one transaction.
+    '''
+    def __init__(self,
+                 bit_map,
+                 address,
+                 max_age = 1.,
+                 **kwargs):
+        '''
+        Args:
+            bit_map (str): name of the bit map of the service
+            address (int): address of the coil or discrete input
+            max_age (float): seconds after which the bit map is read again
+        '''
+        self.bit_map = bit_map
+        self.address = address
+        self.max_age = max_age
+        Entity.__init__(self, **kwargs)
+
+    @calibrate()
+    def on_get(self):
+        if self.bit_map not in self.service.bit_maps:
+            raise ThrowReply('message_error_invalid_value', f"service has no bit map <{self.bit_map}>")
+        bit_map = self.service.bit_maps[self.bit_map]
+        if not bit_map.contains(self.address):
+            raise ThrowReply('message_error_invalid_value', f"address {self.address} of '{self.name}' is not in bit map <{self.bit_map}>")
+        age = bit_map.age(datetime.datetime.now(datetime.timezone.utc))
+        if age is None or age > self.max_age:
+            self.service.refresh_bit_map(self.bit_map)
+        return bit_map.bit(self.address)
+
+    def on_set(self, value):
+        raise ThrowReply('message_error_invalid_method', f"endpoint '{self.name}' does not support set")
@@ -1,3 +1,4 @@
 __all__ = []
 
 from .jitter_endpoint import *
+from .simulated_sensor import *
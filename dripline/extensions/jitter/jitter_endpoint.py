@@ -19,11 +19,13 @@ class JitterEntity(KeyValueStore):
         '''
         KeyValueStore.__init__(self, **kwargs)
         self._jitter_fraction = jitter_fraction
+        # each entity has its own PRNG, so that entities do not interfere with each other's sequence
+        self._random = random.Random()
         self.update_seed(seed)
 
     @calibrate()
     def on_get(self):
-        return self._value * (1 + self._jitter_fraction * random.random())
+        return self._value * (1 + self._jitter_fraction * self._random.random())
 
     @property
     def seed(self):
@@ -42,5 +44,6 @@ class JitterEntity(KeyValueStore):
         of adding and using a function with arbitrary logic.
         '''
         if new_seed is None:
-            self._seed = random.randrange(sys.maxsize)
-        random.seed(self._seed)
+            new_seed = random.randrange(sys.maxsize)
+        self._seed = new_seed
+        self._random.seed(self._seed)
@@ -0,0 +1,83 @@
+try:
+    import numpy as np
+except ImportError:
+    pass
+
+import time
+
+from dripline.core import calibrate, ThrowReply
+from dripline.implementations import KeyValueStore
+
+import logging
+logger = logging.getLogger(__name__)
+
+__all__ = []
+
+__all__.append("SimulatedSensorEntity")
+class SimulatedSensorEntity(KeyValueStore):
+    '''
+    An endpoint simulating a realistic sensor around a stored value, e.g. to generate load on a mesh.
+    Every entity has its own numpy random generator and combines the following noise models, all disabled by default:
+    gaussian noise, a random walk, a linear drift, random steps and dropouts (the get fails as if the device did not reply).
+    Setting the endpoint resets the accumulated walk, drift and steps.
+    '''
+
+    def __init__(self,
+                 noise=0.,
+                 random_walk=0.,
+                 drift=0.,
+                 step_probability=0.,
+                 step_size=0.,
+                 dropout_probability=0.,
+                 seed=None,
+                 **kwargs):
+        '''
+        Args:
+            noise (float): standard deviation of the gaussian noise added to every reading
+            random_walk (float): standard deviation of the random walk, per square root of a second
+            drift (float): linear drift per second
+            step_probability (float): probability per get of a sudden step
+            step_size (float): standard deviation of the step heights
+            dropout_probability (float): probability per get that the sensor does not reply
+            seed (int||None): seed of the entity's random generator
+        '''
+        if not 'np' in globals():
+            raise ImportError('numpy not found, required for SimulatedSensorEntity class')
+        KeyValueStore.__init__(self, **kwargs)
+        self.noise = noise
+        self.random_walk = random_walk
+        self.drift = drift
+        self.step_probability = step_probability
+        self.step_size = step_size
+        self.dropout_probability = dropout_probability
+        self._rng = np.random.default_rng(seed)
+        self._reset_offset()
+
+    def _reset_offset(self):
+        self._offset = 0.
+        self._last_update = time.monotonic()
+
+    def on_set(self, new_value):
+        result = KeyValueStore.on_set(self, new_value)
+        self._reset_offset()
+        return result
+
+    def _advance(self):
+        now = time.monotonic()
+        elapsed = now - self._last_update
+        self._last_update = now
+        self._offset += self.drift * elapsed
+        if self.random_walk:
+            self._offset += self._rng.normal(0., self.random_walk * np.sqrt(elapsed))
+        if self.step_probability and self._rng.random() < self.step_probability:
+            self._offset += self._rng.normal(0., self.step_size)
+
+    @calibrate()
+    def on_get(self):
+        self._advance()
+        if self.dropout_probability and self._rng.random() < self.dropout_probability:
+            raise ThrowReply('device_error_no_resp', f"simulated sensor '{self.name}' dropped out")
+        value = self._value + self._offset
+        if self.noise:
+            value += self._rng.normal(0., self.noise)
+        return float(value)
@@ -1,3 +1,10 @@
+try:
+    import numpy as np
+except ImportError:
+    pass
+
+import math
+
 from dripline.core import Entity, calibrate, ThrowReply
 
 import logging
@@ -5,6 +12,83 @@ logger = logging.getLogger(__name__)
 
 __all__ = []
 
+
+def _encode_uexpo(value):
+    if value == 0:
+        return "000000"
+    if not math.isfinite(value) or value < 0:
+        raise ValueError(f"uexpo can not encode {value}, expect a positive number")
+    expon = math.floor(math.log10(value))
+    mantissa = round(value / 10**expon * 1000)
+    if mantissa >= 10000:
+        mantissa //= 10
+        expon += 1
+    # the two exponent digits are offset by 20
+    if not -20 <= expon <= 79:
+        raise ValueError(f"uexpo can not encode {value}, expect 0 or a value between 1e-20 and 9.999e79")
+    return f"{mantissa:04d}{expon + 20:02d}"
+
+def _decode_uexpo(value):
+    return int(value[:4])/1000. * 10**(int(value[4:]) - 20)
+
+# datatype: (encoder, decoder)
+_codecs = {"bool_old": (lambda value: "111111" if value else "000000", lambda value: value == "111111"),
+           "uint":     (lambda value: f"{value:06d}",                   int),
+           "ureal":    (lambda value: f"{round(value*100):06d}",        lambda value: int(value)/100.),
+           "string":   (lambda value: f"{value:6s}",                    str),
+           "bool":     (lambda value: "1" if value else "0",           lambda value: value == "1"),
+           "ushort":   (lambda value: f"{value:03d}",                   int),
+           "uexpo":    (_encode_uexpo,                                  _decode_uexpo),
+           "str16":    (lambda value: f"{value:16s}",                   str),
+           "str8":     (lambda value: f"{value:8s}",                    str),
+           "query":    (str,                                            str),
+           }
+
+# digit weights and scaling of the numeric datatypes for the vectorized decoding in decode_payloads
+_numeric_weights = {"uint":   ([100000, 10000, 1000, 100, 10, 1], 1.),
+                    "ushort": ([100, 10, 1], 1.),
+                    "ureal":  ([100000, 10000, 1000, 100, 10, 1], 0.01),
+                    }
+
+__all__.append('decode_payloads')
+def decode_payloads(payloads, datatype):
+    '''
+    Decodes a batch of telegram data fields of the same datatype into a numpy array in one pass, e.g. for a sweep over many gauges.
+    Numeric datatypes are returned as float64, with NaN for payloads which are not valid (like device errors "NO_DEF").
+    Boolean datatypes are returned as bool and string datatypes as unicode arrays, invalid payloads raise a ValueError.
+
+    Args:
+        payloads (list): data fields as returned by PfeifferEntity.disensemble_result
+        datatype (str): one of the keys of PfeifferEntity._datatype
+    '''
+    if not 'np' in globals():
+        raise ImportError('numpy not found, required for decode_payloads')
+    if datatype not in PfeifferEntity._datatype:
+        raise ValueError(f"Unknown datatype {datatype}")
+    length = PfeifferEntity._datatype[datatype]
+    if datatype in ["string", "str16", "str8", "query"]:
+        return np.array(payloads, dtype=f"U{length}")
+
+    valid = np.array([len(payload) == length for payload in payloads], dtype=bool)
+    fields = "".join(payload if ok else "0"*length for payload, ok in zip(payloads, valid))
+    digits = np.frombuffer(fields.encode("ascii", errors="replace"), dtype=np.uint8).reshape(len(payloads), length).astype(np.int64) - ord("0")
+    valid &= np.all((digits >= 0) & (digits <= 9), axis=1)
+
+    if datatype in ["bool", "bool_old"]:
+        if not np.all(valid):
+            raise ValueError(f"Invalid {datatype} payloads {[p for p, ok in zip(payloads, valid) if not ok]}")
+        return np.all(digits == 1, axis=1)
+
+    if datatype == "uexpo":
+        mantissa = digits[:, :4] @ np.array([1000, 100, 10, 1])
+        exponent = digits[:, 4:] @ np.array([10, 1])
+        result = mantissa / 1000. * 10.**(exponent - 20)
+    else:
+        weights, scale = _numeric_weights[datatype]
+        result = (digits @ np.array(weights)) * scale
+    return np.where(valid, result, np.nan)
+
+
 __all__.append('PfeifferEntity')
 class PfeifferEntity(Entity):
     '''
@@ -37,57 +121,32 @@ class PfeifferEntity(Entity):
             unit_address (int): number of the unit address, allowed range: 1-16
         '''
         Entity.__init__(self, **kwargs)
+        if datatype not in self._datatype:
+            raise ValueError(f"Unknown datatype {datatype}, expect one of {list(self._datatype.keys())}")
         self.parameter = parameter
         self.datatype = datatype
         self.unit_address = unit_address
+        self._length = self._datatype[datatype]
+        self._encode, self._decode = _codecs[datatype]
 
     def get_checksum(self, string):
         return sum([ord(c) for c in string])%256
 
     def format_value(self, value):
-        if self.datatype == "bool_old":
-            return "111111" if value else "000000"
-        if self.datatype == "bool":
-            return "1" if value else "0"
-        if self.datatype == "string":
-            return f"{value:6s}"
-        if self.datatype == "str8":
-            return f"{value:8s}"
-        if self.datatype == "str16":
-            return f"{value:16s}"
-        if self.datatype == "uint":
-            return f"{value:06d}"
-        if self.datatype == "ushort":
-            return f"{value:03d}"
-        if self.datatype == "ureal":
-            val = int(value*100)
-            return f"{val:06d}"
-        if self.datatype == "uexpo":
-            expon = int(np.log10(val)//1)
-            val = int(val/10**expon*1000)
-            expon_mod = expon - 20
-            return f"{val:04d}{expon_mod:02d}"
-        return value
+        return self._encode(value)
 
     def unformat_value(self, value):
         if value in ["NO_DEF", "_RANGE", "_LOGIC"]:
             raise ValueError(f"Device responded with an error {value}")
-        if len(value) != self._datatype[self.datatype]:
+        if len(value) != self._length:
             raise ValueError(f"data does not match length of datatype")
+        return self._decode(value)
 
-        if self.datatype ==  "bool_old":
-            return value == "111111"
-        if self.datatype == "bool":
-            return value == 1 
-        if self.datatype in ["string", "str16", "str8"]:
-            return value
-        if self.datatype in ["uint", "ushort"]:
-            return int(value)
-        if self.datatype == "ureal":
-            return int(value)/100.
-        if self.datatype == "uexpo":
-            return int(value[:4])/1000. * 10**(int(value[4:]) - 20)
-        return value
+    def unformat_values(self, values):
+        '''
+        Decodes a batch of data fields of this entity's datatype into a numpy array, see decode_payloads
+        '''
+        return decode_payloads(values, self.datatype)
 
     def disensemble_result(self, reply):
         if self.get_checksum(reply[:-3]) != int(reply[-3:]):
@@ -1,4 +1,6 @@
 from dripline.core import Entity, calibrate, ThrowReply
+from .write_behind import WriteBehindQueue
+from .calibration_table import load_calibration_table, table_calibrate
 
 import logging
 logger = logging.getLogger(__name__)
@@ -6,6 +8,7 @@ logger = logging.getLogger(__name__)
 __all__ = []
 __all__.append("ThermoFisherHexGetEntity")
 __all__.append("ThermoFisherNumericGetEntity")
+__all__.append("ThermoFisherNumericEntity")
 
 
 class ThermoFisherHexGetEntity(Entity):
@@ -59,61 +62,75 @@ class ThermoFisherNumericGetEntity(ThermoFisherHexGetEntity):
              11: "kPa",
             }
 
-    def __init__(self, **kwargs):
+    def __init__(self, calibration_table=None, table_interpolation='linear', table_out_of_range='nan', **kwargs):
         '''
         Args:
             get_str: hexstring of the command, e.g. 20
+            calibration_table (str): path of a breakpoint table used instead of calibration
+            table_interpolation (str): 'linear' or 'spline' interpolation of the calibration_table
+            table_out_of_range (str): 'nan', 'clip' or 'extrapolate' for raw values outside of the calibration_table
         '''
+        if calibration_table is not None and kwargs.get('calibration') is not None:
+            raise ValueError('calibration and calibration_table are mutually exclusive')
+        self.calibration_table = None
+        if calibration_table is not None:
+            self.calibration_table = load_calibration_table(calibration_table, table_interpolation, table_out_of_range)
         ThermoFisherHexGetEntity.__init__(self, **kwargs)
+        self.decimal = None
+        self.unit = None
 
-    @calibrate()
+    def parse_result(self, result):
+        '''
+        Converts a reply into its value and caches the decimal prefactor and unit, which are fixed for a given command
+        '''
+        self.decimal = 10.**(-int(result[0], 16))
+        self.unit = self.units[int(result[1], 16)]
+        value = float(int(result[2:], 16))
+        return value*self.decimal
+
+    @table_calibrate()
     def on_get(self):
         # setup cmd here
         to_send = [self.cmd_str]
         logger.debug(f'Send cmd in hexstr: {to_send[0]}')
         result = self.service.send_to_device(to_send)
         logger.debug(f'raw result is: {result}')
- 
-        # do something here
-        decimal = 10.**(-int(result[0], 16))
-        unit = self.units[int(result[1], 16)]
-        value = float(int(result[2:], 16))
-
-        #result = "%f %s"%(value*decimal, unit)
-        result = value*decimal
-        return result
+        return self.parse_result(result)
 
 class ThermoFisherNumericEntity(ThermoFisherNumericGetEntity):
     '''
     A endpoint of a thermo fisher device that can set and get a numerical value
     '''
 
-    def __init__(self, set_str=None, **kwargs):
+    def __init__(self, set_str=None, write_behind=False, max_write_rate=None, **kwargs):
         '''
         Args:
             get_str: hexstring of the get command, e.g. 20
             set_str: hexstring of the set command, e.g. B2
+            write_behind (bool): if True, rapid successive sets are coalesced and only the latest value is written; an error of a delayed write is raised by the next set
+            max_write_rate (float): maximum number of writes per second in write_behind mode, required with write_behind
         '''
         if set_str is None:
             raise ValueError('<set_str is required to __init__ ThermoFisherNumericEntity instance')
         else:
             self.set_str = str(set_str).zfill(2)
         ThermoFisherNumericGetEntity.__init__(self, **kwargs)
+        self._write_queue = None
+        if write_behind:
+            self._write_queue = WriteBehindQueue(self.write_value, max_rate=max_write_rate, name=self.name)
 
-    def on_set(self, value):
-        # we need to get the decimal prefactor from a read command
-        result = self.service.send_to_device([self.cmd_str])
-        decimal = 10.**(-int(result[0], 16))
-        unit = self.units[int(result[1], 16)]
+    def write_value(self, value):
+        # the decimal prefactor is only known from a read command, it is cached after the first one
+        if self.decimal is None:
+            self.parse_result(self.service.send_to_device([self.cmd_str]))
 
-        data = hex(round(value/decimal))[2:].zfill(4)
-        result = self.service.send_to_device([self.set_str + data_str])
+        data = hex(round(value/self.decimal))[2:].zfill(4)
+        result = self.service.send_to_device([self.set_str + data])
 
         # the device returns the read value after a set command
-        decimal = 10.**(-int(result[0], 16))
-        unit = self.units[int(result[1], 16)]
-        value = float(int(result[2:], 16))
+        return self.parse_result(result)
 
-        #result = "%f %s"%(value*decimal, unit)
-        result = value*decimal
-        return result
+    def on_set(self, value):
+        if self._write_queue is not None:
+            return self._write_queue.submit(value)
+        return self.write_value(value)
@@ -0,0 +1,99 @@
+'''
+Contains the WriteBehindQueue class, used by entities to coalesce rapid successive sets
+'''
+
+import threading
+import time
+
+import logging
+logger = logging.getLogger(__name__)
+
+__all__ = []
+
+__all__.append('WriteBehindQueue')
+class WriteBehindQueue(object):
+    '''
+    Write-behind buffer for the setpoint of one endpoint.
+    Values submitted faster than max_rate are not written immediately; only the latest of them is written once the rate allows it.
+    This keeps devices from being flooded by ramp scripts while the latency of a set stays bounded by 1/max_rate.
+    A delayed write runs on a timer thread, so write must be safe to call concurrently with the other device accesses of the service.
+    If a delayed write fails, its error is raised by the next submit.
+    '''
+
+    _empty = object()
+
+    def __init__(self, write, max_rate, name=''):
+        '''
+        Args:
+            write (callable): function writing a value to the device, its return value is passed on for immediate writes
+            max_rate (float): maximum number of writes per second
+            name (str): name used in log messages
+        '''
+        if max_rate is None or not max_rate > 0:
+            raise ValueError(f'<{name}> write-behind requires a positive max_rate, got {max_rate}')
+        self._write = write
+        self.min_interval = 1. / max_rate
+        self.name = name
+        self._lock = threading.Lock()
+        self._pending = self._empty
+        self._last_write = None
+        self._timer = None
+        self._error = None
+
+    def submit(self, value):
+        '''
+        Queues a value to be written. It is written immediately if the rate limit allows it, the result of the write is returned in that case.
+        Otherwise a delayed flush is scheduled (or the already scheduled one will pick up this value) and None is returned.
+        If the last delayed write failed, its error is raised instead and value is not queued.
+        '''
+        with self._lock:
+            if self._error is not None:
+                error, self._error = self._error, None
+                raise error
+            if self._pending is not self._empty:
+                logger.debug(f'<{self.name}> coalesced pending set {self._pending} into {value}')
+            self._pending = value
+            if self._timer is not None:
+                return None
+            if self._last_write is not None:
+                wait = self._last_write + self.min_interval - time.monotonic()
+                if wait > 0:
+                    self._timer = threading.Timer(wait, self._flush_in_background)
+                    self._timer.daemon = True
+                    self._timer.start()
+                    return None
+        return self.flush()
+
+    def flush(self):
+        '''
+        Writes the pending value, if there is one.
+        '''
+        with self._lock:
+            self._timer = None
+            if self._pending is self._empty:
+                return None
+            value = self._pending
+            self._pending = self._empty
+            self._last_write = time.monotonic()
+        logger.debug(f'<{self.name}> writing {value}')
+        return self._write(value)
+
+    def _flush_in_background(self):
+        try:
+            self.flush()
+        except Exception as e:
+            # the set already replied, the error is kept for the next submit
+            logger.error(f'<{self.name}> delayed write failed: {e}')
+            with self._lock:
+                self._error = e
+
+    def cancel(self):
+        '''
+        Drops the pending value and any scheduled flush.
+        '''
+        with self._lock:
+            if self._timer is not None:
+                self._timer.cancel()
+            self._timer = None
+            self._pending = self._empty
+            self._error = None
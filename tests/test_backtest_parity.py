@@ -0,0 +1,61 @@
+'''
+The offline backtest must fire exactly when the live WatchDog would, for the values as they are recorded.
+'''
+import csv
+import os
+import sys
+
+import numpy as np
+import pytest
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), "..", "dragonfly"))
+from backtest import load_series
+from rules import compare, compare_array
+
+live_series = {"status": ["00", "0", "01", "00"],
+               "pressure": [0.5, 1.5, 2.0, float("nan"), 1e-5],
+               "state": ["OK", "NO", "OK"],
+               }
+references = ["00", "0", 1, 1.0, "1.5"]
+methods = ["not_equal", "equal", "lower", "greater"]
+
+def live_result(values, reference, method):
+    try:
+        return [bool(compare(value, reference, method)) for value in values]
+    except (TypeError, ValueError) as e:
+        return type(e)
+
+def backtest_result(values, reference, method):
+    try:
+        return compare_array(values, reference, method).tolist()
+    except (TypeError, ValueError) as e:
+        return type(e)
+
+
+@pytest.fixture(scope="module")
+def recorded(tmp_path_factory):
+    path = tmp_path_factory.mktemp("backtest") / "recorded.csv"
+    with open(path, "w", newline="") as open_file:
+        writer = csv.writer(open_file)
+        writer.writerow(["timestamp", "endpoint", "value"])
+        for endpoint, values in live_series.items():
+            for i, value in enumerate(values):
+                writer.writerow([i, endpoint, value])
+    return load_series(path)
+
+
+@pytest.mark.parametrize("endpoint", list(live_series))
+@pytest.mark.parametrize("reference", references)
+@pytest.mark.parametrize("method", methods)
+def test_csv_parity(recorded, endpoint, reference, method):
+    values = recorded[endpoint][1]
+    assert backtest_result(values, reference, method) == live_result(live_series[endpoint], reference, method)
+
+
+@pytest.mark.parametrize("values", [[0, 1, 2], [True, False], ["00", 1, 2.5]])
+@pytest.mark.parametrize("reference", references)
+@pytest.mark.parametrize("method", methods)
+def test_typed_parity(values, reference, method):
+    # typed columns as read from parquet
+    array = np.array(values, dtype=object if len({type(v) for v in values}) > 1 else None)
+    assert backtest_result(array, reference, method) == live_result(values, reference, method)